@@ -0,0 +1,47 @@
+"""
+Compares the elbow configuration choices of chooseangle on station-to-station moves on the NR9 emulator
+
+The arm travels between random cells of a vial tray and the uncapper. Choosing the closest shoulder angle is
+compared with choosing the configuration with the shortest predicted move (anglechoice='time'), by the motion
+time the emulator spends on the moves. Motion times are scaled down by TIMESCALE to keep the run short.
+
+Linux/macOS only (requires a pty).
+"""
+import random
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._emulator import Emulator
+from PyNR.dependencies.components import VialTray
+
+TIMESCALE = 0.01
+UNCAPPER = {'x': -188.36, 'y': 200.585}
+
+
+def route(moves=200, seed=0):
+    """returns a list of station targets (cells of a tray alternating with the uncapper)"""
+    tray = VialTray(population={})
+    cells = [location for row in tray.locarray[:5] for location in row]  # the rows within reach of the arm
+    rng = random.Random(seed)
+    return [dict(rng.choice(cells)) if i % 2 == 0 else dict(UNCAPPER) for i in range(moves)]
+
+
+def run(anglechoice, targets):
+    """returns the emulated motion seconds per move"""
+    emulator = Emulator(timescale=TIMESCALE, hometime=0.).start()
+    n9 = Communicator(port=emulator.port, acceleration=35000, velocity=15000, anglechoice=anglechoice)
+    motion = emulator.motiontime
+    for target in targets:
+        n9.goto({'x': target['x'], 'y': target['y']})
+    n9.drain()
+    motion = emulator.motiontime - motion
+    n9.disconnect(roughhome=False)
+    emulator.stop()
+    return motion / TIMESCALE / len(targets)
+
+
+if __name__ == '__main__':
+    targets = route()
+    shoulder = run('shoulder', targets)
+    fastest = run('time', targets)
+    print('closest shoulder:\t%.3f s per move' % shoulder)
+    print('fastest move:\t\t%.3f s per move (%.0f %% faster)' % (fastest, 100. * (1. - fastest / shoulder)))
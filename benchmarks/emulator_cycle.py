@@ -0,0 +1,111 @@
+"""
+End-to-end benchmark of the uncap loop from 'test script 4.py' against the NR9 emulator
+
+Reports the time per vial and the share of it which was not spent on (emulated) motion, i.e. host-side and
+serial overhead plus fixed sleeps. Motion times are scaled down by TIMESCALE to keep the run short.
+
+Each loop is also run with the previous output behaviour (every output written, then a blocking 0.2 s sleep) to
+show the effect of the output cache and the per-output settle times (see Communicator.output). The uncap loop
+gains nothing: every output in it is followed by a move which depends on it, so the 0.2 s settle time of the
+gripper outputs (robot_parameters.settle) still gates each of those moves. The transfer loop is synthetic, written
+to show where the cache and settle times do help: it releases both grippers before each pickup (redundant after
+the first vial), and the vial gripper does not act on the shoulder/elbow move which follows.
+
+Linux/macOS only (requires a pty).
+"""
+import time
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._emulator import Emulator
+from PyNR.dependencies.components import VialTray
+from PyNR.dependencies.vialprofiles import profiles
+
+TIMESCALE = 0.05
+
+
+def uncap_loop(n9, tray, newplaces):
+    """the vial handling loop of 'test script 4.py' (without the fill wait)"""
+    ucloc = {'x': -188.36, 'y': 200.585}
+    disploc = None
+    n9.goto(3, 9000)
+    for ind, vial in enumerate(tray):
+        n9.goto(vial.location, {3: 10900})  # go to vial
+        n9.output('gripper', 1)  # grip
+        n9.goto(3, 7000)  # move up
+
+        n9.goto(ucloc, {3: 8700})  # move to vial gripper
+        n9.output('vial_gripper', 1)
+
+        gr = n9.loc[0]
+        z = n9.loc[3]
+        rotcounts = (gr - 2 * 4000)
+        upcounts = (z - 2 * vial.p['pitch'] * n9.kw['zcountspermm'])
+        n9.goto({3: upcounts, 0: rotcounts})
+
+        if disploc is None:
+            disploc = n9.chooseangle(n9.inverse_kinematics(-188.36, 200.585, el_gr=210.879))
+        n9.goto({3: 7000}, disploc, {3: 8700})
+        n9.goto({3: 7000}, ucloc, {3: upcounts})
+        n9.goto({0: gr, 3: z})
+        n9.output('vial_gripper', 0)
+        n9.goto({3: 7000})
+        n9.goto(tray[newplaces[ind]], {3: 10900})
+        n9.output(3, 0)
+        n9.goto(3, 7000)
+
+
+def transfer_loop(n9, tray, newplaces):
+    """moves each vial to a new place, releasing both grippers before each pickup (synthetic, not from a script)"""
+    n9.goto(3, 7000)
+    for ind, vial in enumerate(tray):
+        n9.output('gripper', 0)
+        n9.output('vial_gripper', 0)
+        n9.goto(vial.location, {3: 10900})
+        n9.output('gripper', 1)
+        n9.goto(3, 7000)
+        n9.goto(tray[newplaces[ind]], {3: 10900})
+        n9.output('gripper', 0)
+        n9.goto(3, 7000)
+
+
+def forced(n9, sleep=0.2):
+    """restores the previous output behaviour on the communicator: every output is written, then the caller sleeps"""
+    def output(axis, value, sleep=sleep):
+        Communicator.output(n9, axis, value, sleep=0., force=True)
+        n9.drain()  # the output used to be acknowledged before the sleep
+        time.sleep(sleep)
+    n9.output = output
+
+
+def run(loop=uncap_loop, force=False, **kwargs):
+    """
+    runs the loop on a fresh emulator and returns (seconds per vial, emulated motion seconds per vial)
+
+    force: whether to use the previous output behaviour (see forced)
+
+    keyword arguments are passed to the Communicator
+    """
+    emulator = Emulator(timescale=TIMESCALE, hometime=0.).start()
+    tray = VialTray(population={'H9': {}, 'H10': {}, 'H11': {}, 'H12': {}},
+                    vialproperties=profiles['HPLC1mLpierce'])
+    n9 = Communicator(port=emulator.port, acceleration=35000, velocity=15000, **kwargs)
+    if force:
+        forced(n9)
+    t0 = time.perf_counter()
+    motion = emulator.motiontime
+    loop(n9, tray, ['G9', 'G10', 'G11', 'G12'])
+    n9.drain()
+    elapsed = time.perf_counter() - t0
+    motion = emulator.motiontime - motion
+    n9.disconnect(roughhome=False)
+    emulator.stop()
+    return elapsed / 4, motion / 4
+
+
+if __name__ == '__main__':
+    print('motion scaled by %.2f' % TIMESCALE)
+    for loop in [uncap_loop, transfer_loop]:
+        for force in [True, False]:
+            pervial, motion = run(loop, force)
+            print('%s, %s:\t%.3f s per vial (%.3f s motion, %.3f s overhead)' % (
+                loop.__name__, 'forced sleeps' if force else 'cached outputs', pervial, motion, pervial - motion))
@@ -0,0 +1,41 @@
+"""
+Microbenchmark of command encoding
+
+Compares the original per-call string building (dictionary lookup, argument count check, velocity/acceleration
+dictionary copy, string concatenation and pkg) with the precompiled encoders from _commands.compile_commands.
+"""
+import timeit
+
+from PyNR.dependencies._commands import commands, compile_commands
+
+
+def legacy_encode(cmd, *args, va={'v': 10000, 'a': 75000}, **kwargs):
+    """the original encoding path of Communicator.execute"""
+    cmddct = commands[cmd]
+    if len(args) != cmddct['nargs']:
+        if len(args) >= cmddct['nargs'] - 2 and len(args) < cmddct['nargs'] and cmddct['va'] is True:
+            args = list(args)
+            va = dict(va)
+            va.update(**kwargs)
+            args.append(va['a'])
+            args.append(va['v'])
+    strcmd = cmddct['CMD']
+    for i, v in enumerate(args):
+        strcmd += ' V' + str(i + 1) + '[' + str(round(v)) + ']'
+    return ('<' + strcmd + '\r').encode('utf-8')
+
+
+if __name__ == '__main__':
+    encoders = compile_commands(commands, 75000, 10000)
+    assert legacy_encode('movesync', 1, 2, 2550, 4350.4) == encoders['movesync'](1, 2, 2550, 4350.4)
+
+    n = 200000
+    cases = [
+        ('move', (3, 7000)),
+        ('movesync', (1, 2, 2550, 4350)),
+        ('output', (3, 1)),
+    ]
+    for cmd, args in cases:
+        legacy = timeit.timeit(lambda: legacy_encode(cmd, *args), number=n) / n * 1e6
+        compiled = timeit.timeit(lambda: encoders[cmd](*args), number=n) / n * 1e6
+        print('%-10s legacy: %.2f us\tcompiled: %.2f us\t(%.1fx)' % (cmd, legacy, compiled, legacy / compiled))
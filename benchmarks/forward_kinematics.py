@@ -0,0 +1,62 @@
+"""
+Compares the scalar and vectorized forward kinematics over 10^5 logged positions, and checks the round trip
+through the inverse kinematics across the workspace
+
+The round trip converts a grid of reachable targets to counts (both elbow configurations) and back to
+coordinates with the offsets applied. The error is bounded by the rounding of the counts.
+"""
+import time
+
+import numpy as np
+
+from PyNR.dependencies._communicator import Communicator
+
+POINTS = 100000
+
+
+def convert(n9, points=POINTS, seed=0):
+    """returns (scalar seconds, vectorized seconds, largest difference in mm)"""
+    rng = np.random.default_rng(seed)
+    counts = np.column_stack([  # a log of axis counts within the ranges of the axes
+        rng.integers(0, 10000, points),
+        rng.integers(0, 21050, points),
+        rng.integers(0, 33200, points),
+        rng.integers(0, 12250, points),
+    ])
+    start = time.perf_counter()
+    scalar = [n9.forward_kinematics({axis: int(value) for axis, value in enumerate(row)}) for row in counts.tolist()]
+    scalartime = time.perf_counter() - start
+    start = time.perf_counter()
+    vector = n9.forward_kinematics_array(counts)
+    vectortime = time.perf_counter() - start
+    difference = max(
+        np.max(np.abs(np.array([dct['x'] for dct in scalar]) - vector['x'])),
+        np.max(np.abs(np.array([dct['y'] for dct in scalar]) - vector['y'])),
+    )
+    return scalartime, vectortime, difference
+
+
+def roundtrip(n9, spacing=1.):
+    """returns (number of reachable targets, largest round trip error in mm)"""
+    xs, ys = np.meshgrid(np.arange(-340., 340., spacing), np.arange(-340., 340., spacing))
+    xs = xs.ravel()
+    ys = ys.ravel()
+    shright, shleft, reachable = n9.inverse_kinematics_array(xs, ys)
+    error = 0.
+    for configuration in [shright, shleft]:
+        counts = np.zeros((len(xs), 3), dtype=np.int64)
+        counts[:, 1] = configuration[1]
+        counts[:, 2] = configuration[2]
+        back = n9.forward_kinematics_array(counts[reachable], offset=True)
+        error = max(error, np.max(np.hypot(back['x'] - xs[reachable], back['y'] - ys[reachable])))
+    return int(np.count_nonzero(reachable)), error
+
+
+if __name__ == '__main__':
+    n9 = Communicator(offline=True)
+    scalartime, vectortime, difference = convert(n9)
+    print('scalar:\t\t%.1f ms (%.2f us per position)' % (scalartime * 1e3, scalartime / POINTS * 1e6))
+    print('vectorized:\t%.1f ms (%.3f us per position, %.0fx, largest difference %.1e mm)' % (
+        vectortime * 1e3, vectortime / POINTS * 1e6, scalartime / vectortime, difference))
+    targets, error = roundtrip(n9)
+    print('round trip:\t%d reachable targets on a 1 mm grid, largest error %.3f mm' % (targets, error))
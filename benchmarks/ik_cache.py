@@ -0,0 +1,38 @@
+"""
+Measures the inverse kinematics cache on a protocol which revisits the same few bed coordinates
+
+Every cell of a vial tray is visited along with the uncapper and the dispenser (reached with a longer effective
+arm), as the uncap loop of 'test script 4.py' does, for many runs. The time spent in inverse_kinematics is
+compared with the cache disabled, and the cached solutions are checked against the uncached ones.
+"""
+import time
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies.components import VialTray
+from PyNR.dependencies.vialprofiles import profiles
+
+UNCAPPER = {'x': -188.36, 'y': 200.585}
+
+
+def run(ikcache, runs=200):
+    """returns (microseconds per solution, cache statistics, solutions of the last run)"""
+    n9 = Communicator(offline=True, ikcache=ikcache)
+    tray = VialTray(population={}, vialproperties=profiles['HPLC1mLpierce'])
+    targets = []
+    for row in tray.locarray:
+        for location in row:
+            targets += [(location, {}), (UNCAPPER, {}), (UNCAPPER, {'el_gr': 210.879})]
+    start = time.perf_counter()
+    for i in range(runs):
+        solutions = [n9.inverse_kinematics(target, **kwargs) for target, kwargs in targets]
+    elapsed = time.perf_counter() - start
+    stats = n9.ikcache.cache_info() if ikcache > 0 else None
+    return elapsed / (runs * len(targets)) * 1e6, stats, solutions
+
+
+if __name__ == '__main__':
+    uncached, stats, expected = run(0)
+    cached, stats, solutions = run(1024)
+    print('uncached:\t%.2f us per solution' % uncached)
+    print('cached:\t\t%.2f us per solution (%.1fx, %d hits, %d misses, %s)' % (
+        cached, uncached / cached, stats.hits, stats.misses, 'identical' if solutions == expected else 'DIFFERENT'))
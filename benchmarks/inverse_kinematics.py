@@ -0,0 +1,51 @@
+"""
+Compares the scalar and vectorized inverse kinematics over 10^5 targets spread over the bed
+
+The vectorized counts are checked against the scalar counts for every reachable target, and the unreachable
+targets (where the scalar path raises a math domain error) against the reachable mask.
+"""
+import time
+
+import numpy as np
+
+from PyNR.dependencies._communicator import Communicator
+
+POINTS = 100000
+
+
+def run(points=POINTS, seed=0):
+    """returns (scalar seconds, vectorized seconds, number of mismatches, number of unreachable targets)"""
+    n9 = Communicator(offline=True)
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(-360., 360., points)  # includes targets beyond the reach of the arm
+    ys = rng.uniform(-100., 360., points)
+
+    start = time.perf_counter()
+    scalar = []
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        try:
+            scalar.append(n9.inverse_kinematics(x, y))
+        except (ValueError, ZeroDivisionError):  # unreachable
+            scalar.append(None)
+    scalartime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shright, shleft, reachable = n9.inverse_kinematics_array(xs, ys)
+    vectortime = time.perf_counter() - start
+
+    mismatches = 0
+    for i, solution in enumerate(scalar):
+        if solution is None:
+            mismatches += bool(reachable[i])
+        elif reachable[i] == False or solution != (
+                {2: int(shright[2][i]), 1: int(shright[1][i])}, {2: int(shleft[2][i]), 1: int(shleft[1][i])}):
+            mismatches += 1
+    return scalartime, vectortime, mismatches, int(np.count_nonzero(~reachable))
+
+
+if __name__ == '__main__':
+    scalartime, vectortime, mismatches, unreachable = run()
+    print('scalar:\t\t%.1f ms (%.2f us per target)' % (scalartime * 1e3, scalartime / POINTS * 1e6))
+    print('vectorized:\t%.1f ms (%.3f us per target, %.0fx)' % (
+        vectortime * 1e3, vectortime / POINTS * 1e6, scalartime / vectortime))
+    print('%d mismatches, %d of %d targets unreachable' % (mismatches, unreachable, POINTS))
@@ -0,0 +1,51 @@
+"""
+Measures the overhead of the latency metrics (Communicator(metrics=True))
+
+The echo robot from read_latency.py acknowledges every command as soon as it arrives, which is the worst case
+for the relative cost of instrumentation. Runs with and without metrics are interleaved and the fastest of
+each is compared. The direct cost of recording a command is also timed on its own.
+
+Linux/macOS only (requires a pty).
+"""
+import os
+import sys
+import threading
+import time
+import timeit
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._metrics import Metrics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from read_latency import echo_robot
+
+
+def run(n9, n):
+    """returns the mean time per output command in seconds"""
+    t0 = time.perf_counter()
+    for i in range(n):
+        n9.execute('output', 3, i % 2)
+    return (time.perf_counter() - t0) / n
+
+
+if __name__ == '__main__':
+    master, slave = os.openpty()
+    threading.Thread(target=echo_robot, args=(master,), daemon=True).start()
+    port = os.ttyname(slave)
+    plain = Communicator(port=port, homeinitialize=False)
+    instrumented = Communicator(port=port, homeinitialize=False, metrics=True)
+
+    n = 500
+    off = []
+    on = []
+    for repeat in range(5):
+        off.append(run(plain, n))
+        on.append(run(instrumented, n))
+    print('without metrics:\t%.1f us per command' % (min(off) * 1e6))
+    print('with metrics:\t\t%.1f us per command (%+.2f %%)' % (min(on) * 1e6, (min(on) / min(off) - 1) * 100))
+
+    metrics = Metrics()
+    data = plain.encode('output', 3, 1)
+    cost = timeit.timeit(lambda: metrics.command(data, 0.0021), number=100000) / 100000
+    print('recording a command:\t%.2f us (%.3f %% of a round trip)' % (cost * 1e6, cost / min(off) * 100))
+    print(instrumented.metrics.prometheus())
@@ -0,0 +1,43 @@
+"""
+Measures the cost of background position polling to a protocol on the NR9 emulator
+
+A threaded communicator runs a sequence of moves while a Poller queues position requests at BACKGROUND
+priority. The move time is compared with a run without polling. Moves are acknowledged when they finish, so a
+position request can only be answered between moves while the robot is busy and at most one sample is taken
+per move; the rest of the intervals are skipped.
+
+Linux/macOS only (requires a pty).
+"""
+import time
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._emulator import Emulator
+from PyNR.dependencies._poller import Poller
+
+TIMESCALE = 0.1
+
+
+def run(interval, moves=100):
+    """returns (seconds per move, number of samples written, samples per second)"""
+    emulator = Emulator(timescale=TIMESCALE, hometime=0.).start()
+    n9 = Communicator(port=emulator.port, threaded=True)
+    poller = Poller(n9, interval=interval) if interval is not None else None
+    start = time.perf_counter()
+    for i in range(moves):
+        n9.goto({3: 2000 + 3000 * (i % 2)})
+    elapsed = time.perf_counter() - start
+    samples = 0
+    if poller is not None:
+        poller.stop()
+        samples = poller.ring.written
+        poller.close()
+    n9.disconnect(roughhome=False)
+    emulator.stop()
+    return elapsed / moves, samples, samples / elapsed
+
+
+if __name__ == '__main__':
+    for interval in [None, 0.1, 0.01, 0.001]:
+        elapsed, samples, rate = run(interval)
+        print('interval %s:\t%.2f ms per move, %d samples (%.0f per s)' % (
+            interval, elapsed * 1e3, samples, rate))
@@ -0,0 +1,51 @@
+"""
+Measures how the throughput of the uncap loop of emulator_cycle.py scales with the number of cells in a
+RobotPool, each cell being its own NR9 emulator
+
+Linux/macOS only (requires a pty).
+"""
+import os
+import sys
+import time
+
+from PyNR.dependencies._emulator import Emulator
+from PyNR.dependencies.components import VialTray
+from PyNR.dependencies.pool import RobotPool
+from PyNR.dependencies.vialprofiles import profiles
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from emulator_cycle import TIMESCALE, uncap_loop
+
+
+def protocol(n9):
+    tray = VialTray(population={'H9': {}, 'H10': {}, 'H11': {}, 'H12': {}},
+                    vialproperties=profiles['HPLC1mLpierce'])
+    uncap_loop(n9, tray, ['G9', 'G10', 'G11', 'G12'])
+    n9.drain()
+    return len(tray.vials)
+
+
+def run(cells):
+    """returns the number of vials handled per second by the pool"""
+    emulators = [Emulator(timescale=TIMESCALE, hometime=0.).start() for i in range(cells)]
+    pool = RobotPool({'cell%d' % i: {'port': emulator.port} for i, emulator in enumerate(emulators)},
+                     acceleration=35000, velocity=15000, metrics=True)
+    t0 = time.perf_counter()
+    results = pool.gather(pool.map(protocol))
+    elapsed = time.perf_counter() - t0
+    errors = [error for error in results.values() if isinstance(error, Exception)]
+    if len(errors) != 0:
+        raise errors[0]
+    commands = sum(stats['count'] for stats in pool.metrics().snapshot()['commands'].values())
+    pool.close(roughhome=False)
+    for emulator in emulators:
+        emulator.stop()
+    return 4 * cells / elapsed, commands
+
+
+if __name__ == '__main__':
+    single = None
+    for cells in [1, 2, 4, 8]:
+        rate, commands = run(cells)
+        single = rate if single is None else single
+        print('%d cells:\t%.2f vials/s (%.2fx, %d commands)' % (cells, rate, rate / single, commands))
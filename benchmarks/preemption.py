@@ -0,0 +1,42 @@
+"""
+Measures how quickly a deep queue of moves can be stopped on the NR9 emulator
+
+A threaded communicator is given a long queue of moves. After a short while, stop() drops everything which
+has not been written and confirms the stop with an urgent echo. The stop latency is bounded by the moves
+already in flight (the sendahead window), not by the depth of the queue.
+
+Linux/macOS only (requires a pty).
+"""
+import time
+
+from PyNR.dependencies._communicator import Communicator, Preempted
+from PyNR.dependencies._emulator import Emulator
+
+TIMESCALE = 0.1
+
+
+def run(sendahead, depth=200):
+    """returns (stop latency in s, number of preempted moves, mean emulated move time in s)"""
+    emulator = Emulator(timescale=TIMESCALE, hometime=0.).start()
+    n9 = Communicator(port=emulator.port, threaded=True, sendahead=sendahead, metrics=True)
+    futures = [n9.submit('move', 3, 2000 + 3000 * (i % 2)) for i in range(depth)]
+    time.sleep(0.3)
+    latency = n9.stop()
+    preempted = 0
+    for future in futures:
+        try:
+            future.result()
+        except Preempted:
+            preempted += 1
+    moved = depth - preempted
+    motion = emulator.motiontime / moved if moved != 0 else 0.
+    n9.disconnect(roughhome=False)
+    emulator.stop()
+    return latency, preempted, motion
+
+
+if __name__ == '__main__':
+    for sendahead in [1, 2, 4]:
+        latency, preempted, motion = run(sendahead)
+        print('sendahead %d:\tstopped in %.1f ms (%d of 200 moves preempted, %.1f ms per move)' % (
+            sendahead, latency * 1e3, preempted, motion * 1e3))
@@ -0,0 +1,44 @@
+"""
+Measures the reachability map: building it, reloading it from the cache, and validating targets with it
+
+Each lookup is checked against solving the target exactly and testing the counts against the joint ranges,
+over 10^5 targets spread over (and beyond) the bed.
+"""
+import tempfile
+import time
+
+import numpy as np
+
+from PyNR.dependencies._communicator import Communicator
+
+POINTS = 100000
+
+
+def run(points=POINTS, seed=0):
+    """returns (build s, load s, lookup us, exact us, mismatches, unreachable targets)"""
+    cache = tempfile.mkdtemp()
+    start = time.perf_counter()
+    reach = Communicator(offline=True, reachcache=cache).reachability()
+    buildtime = time.perf_counter() - start
+    start = time.perf_counter()
+    Communicator(offline=True, reachcache=cache).reachability()  # a later session loads the saved map
+    loadtime = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    targets = list(zip(rng.uniform(-360., 360., points).tolist(), rng.uniform(-360., 360., points).tolist()))
+    start = time.perf_counter()
+    looked = [reach.lookup(x, y) for x, y in targets]
+    lookuptime = time.perf_counter() - start
+    start = time.perf_counter()
+    exact = [reach.exact(x, y) for x, y in targets]
+    exacttime = time.perf_counter() - start
+    mismatches = sum(a != b for a, b in zip(looked, exact))
+    return (buildtime, loadtime, lookuptime / points * 1e6, exacttime / points * 1e6, mismatches,
+            sum(len(a) == 0 for a in looked))
+
+
+if __name__ == '__main__':
+    buildtime, loadtime, lookup, exact, mismatches, unreachable = run()
+    print('build:\t\t%.1f ms, reload from the cache: %.1f ms' % (buildtime * 1e3, loadtime * 1e3))
+    print('lookup:\t\t%.2f us per target (exact solution %.2f us, %.1fx)' % (lookup, exact, exact / lookup))
+    print('%d mismatches, %d of %d targets unreachable' % (mismatches, unreachable, POINTS))
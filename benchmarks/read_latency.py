@@ -0,0 +1,62 @@
+"""
+Benchmarks the acknowledgement latency of Communicator.read
+
+A thread on the master side of a pseudo-terminal plays the robot and echoes every command back as soon as it
+arrives, so the measured time is almost entirely host-side read overhead. The legacy inWaiting/sleep poll loop
+is kept here for comparison.
+
+Linux/macOS only (requires a pty).
+"""
+import os
+import threading
+import time
+
+from PyNR.dependencies._communicator import Communicator
+
+
+def legacy_read(comm, sleeptime=0.01):
+    """the original inWaiting/sleep poll loop from Communicator.read"""
+    buffer = ''
+    while buffer.endswith('>\r') is False:
+        waiting = comm.sercon.inWaiting()
+        while waiting == 0:
+            time.sleep(sleeptime)
+            waiting = comm.sercon.inWaiting()
+        buffer += comm.sercon.read(waiting).decode('ascii')
+    return buffer
+
+
+def echo_robot(fd):
+    """echoes each '<COMMAND\\r' back as '<COMMAND>\\r' after a short processing delay"""
+    buffer = b''
+    while True:
+        try:
+            buffer += os.read(fd, 1024)
+        except OSError:  # the pty was closed
+            return
+        while b'\r' in buffer:
+            frame, buffer = buffer.split(b'\r', 1)
+            time.sleep(0.002)  # firmware processing time
+            os.write(fd, frame + b'>\r')
+
+
+def run(reader, comm, n):
+    """returns the mean acknowledgement latency in ms for n ECHO commands"""
+    t0 = time.perf_counter()
+    for i in range(n):
+        comm.sercon.write(comm.pkg('ECHO'))
+        reader()
+    return (time.perf_counter() - t0) / n * 1000.
+
+
+if __name__ == '__main__':
+    master, slave = os.openpty()
+    threading.Thread(target=echo_robot, args=(master,), daemon=True).start()
+
+    n9 = Communicator(port=os.ttyname(slave), homeinitialize=False)
+    n9.sercon.write(n9.pkg('ECHO'))  # warm up
+    n9.read()
+
+    repeats = 200
+    print('legacy poll loop:\t%.2f ms per command' % run(lambda: legacy_read(n9), n9, repeats))
+    print('blocking read:\t\t%.2f ms per command' % run(n9.read, n9, repeats))
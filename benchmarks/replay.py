@@ -0,0 +1,48 @@
+"""
+Records the uncap loop of emulator_cycle.py against the NR9 emulator and replays the recorded session
+
+Replaying at a timescale of 0 serves every response as soon as the command it answers has been written, so
+the replayed run time is the host-side cost of the loop alone (encoding, planning, framing and the fixed output
+sleeps). A recording made on the robot (Communicator(record='session.nr9')) can be replayed the same way to
+check a change to the communicator for performance regressions without the hardware.
+
+Linux/macOS only (requires a pty to record).
+"""
+import os
+import sys
+import tempfile
+import time
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._transport import ReplayTransport, read_recording
+from PyNR.dependencies.components import VialTray
+from PyNR.dependencies.vialprofiles import profiles
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from emulator_cycle import run, uncap_loop
+
+
+def replay(path, timescale=0.):
+    """replays the recorded uncap loop and returns (seconds per vial, number of writes which did not match)"""
+    transport = ReplayTransport(path, timescale=timescale)
+    tray = VialTray(population={'H9': {}, 'H10': {}, 'H11': {}, 'H12': {}},
+                    vialproperties=profiles['HPLC1mLpierce'])
+    n9 = Communicator(transport=transport, acceleration=35000, velocity=15000)
+    t0 = time.perf_counter()
+    uncap_loop(n9, tray, ['G9', 'G10', 'G11', 'G12'])
+    n9.drain()
+    elapsed = time.perf_counter() - t0
+    n9.disconnect(roughhome=False)
+    return elapsed / 4, transport.mismatches
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.gettempdir(), 'uncap_loop.nr9')
+    if os.path.isfile(path) is False:
+        pervial, motion = run(record=path)
+        print('recorded %.3f s per vial to %s' % (pervial, path))
+    print('%d chunks in the recording' % len(read_recording(path)))
+    pervial, mismatches = replay(path, timescale=1.)
+    print('replayed with original timing:\t%.3f s per vial (%d mismatched writes)' % (pervial, mismatches))
+    pervial, mismatches = replay(path)
+    print('replayed without waiting:\t%.3f s per vial (%d mismatched writes)' % (pervial, mismatches))
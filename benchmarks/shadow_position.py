@@ -0,0 +1,39 @@
+"""
+Measures the cost of position checks between moves on the NR9 emulator, with and without the shadow state
+
+Protocols often check the position after each move. Without the shadow state every check is a POSR round trip;
+with it the counts after the acknowledged moves are returned from memory and only reconciled with a POSR at the
+end (and whenever a command fails or the reconcile period passes).
+
+Linux/macOS only (requires a pty).
+"""
+import time
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._emulator import Emulator
+
+TIMESCALE = 0.
+
+
+def run(shadow, moves=200):
+    """returns (seconds per move and check, number of POSR commands sent)"""
+    emulator = Emulator(timescale=TIMESCALE, hometime=0.).start()
+    n9 = Communicator(port=emulator.port, shadow=shadow, metrics=True)
+    start = time.perf_counter()
+    for i in range(moves):
+        counts = 2000 + 3000 * (i % 2)
+        n9.goto({3: counts})
+        if n9.position()[3] != counts:
+            raise ValueError('The position check failed after move %d' % i)
+    n9.position(refresh=True)  # a final reconciliation with the robot
+    elapsed = time.perf_counter() - start
+    posr = n9.metrics.latency[b'POSR'].count
+    n9.disconnect(roughhome=False)
+    emulator.stop()
+    return elapsed / moves, posr
+
+
+if __name__ == '__main__':
+    for shadow in [False, True]:
+        elapsed, posr = run(shadow)
+        print('shadow %s:\t%.3f ms per move and check (%d POSR round trips)' % (shadow, elapsed * 1e3, posr))
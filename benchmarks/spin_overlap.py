@@ -0,0 +1,39 @@
+"""
+Measures the time saved by running a mixing spin alongside arm motion on the NR9 emulator
+
+Each cycle spins the gripper to mix, travels with the shoulder and elbow to the next station and then turns the
+gripper rotation. Waiting for every spin to finish before travelling is compared with letting the travel overlap
+the spin (the gripper rotation waits for the spin on its own, see Communicator.waitfor).
+
+Spins are timed by the communicator in real time, so the emulator runs at full speed.
+
+Linux/macOS only (requires a pty).
+"""
+import time
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._emulator import Emulator
+
+STATIONS = [{1: 4000, 2: 6000}, {1: 12000, 2: 9000}]
+
+
+def run(overlap, cycles=4, mixing=0.5):
+    """returns the seconds per cycle"""
+    emulator = Emulator(timescale=1., hometime=0.).start()
+    n9 = Communicator(port=emulator.port, velocity=20000)
+    start = time.perf_counter()
+    for i in range(cycles):
+        n9.spin(mixing, wait=overlap is False)
+        n9.goto(STATIONS[i % 2])
+        n9.goto({0: n9.loc[0] + 4000})
+    elapsed = time.perf_counter() - start
+    n9.disconnect(roughhome=False)
+    emulator.stop()
+    return elapsed / cycles
+
+
+if __name__ == '__main__':
+    sequential = run(False)
+    overlapped = run(True)
+    print('sequential:\t%.3f s per cycle' % sequential)
+    print('overlapped:\t%.3f s per cycle (%.0f %% faster)' % (overlapped, 100. * (1. - overlapped / sequential)))
@@ -0,0 +1,31 @@
+"""
+Compares per-call kinematic overrides with a precomputed tool profile
+
+The dispenser is reached with a longer effective arm. 'test script 4.py' used to pass el_gr=210.879 on every call,
+which derives the kinematic parameters each time; a tool handle (see head_modules.Head) derives them once. Both
+are timed with and without the inverse kinematics cache, and checked to give the same counts.
+"""
+import timeit
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies.head_modules import Head
+
+DISPENSER = (-188.36, 200.585)
+
+
+def run(ikcache, number=100000):
+    """returns (override microseconds, handle microseconds, whether the solutions are identical) per solution"""
+    n9 = Communicator(offline=True, ikcache=ikcache)
+    dispenser = Head(n9, tool='dispenser')
+    override = min(timeit.repeat(lambda: n9.inverse_kinematics(*DISPENSER, el_gr=210.879), number=number, repeat=3))
+    handle = min(timeit.repeat(lambda: n9.inverse_kinematics(*DISPENSER, tool=dispenser), number=number, repeat=3))
+    identical = n9.inverse_kinematics(*DISPENSER, el_gr=210.879) == n9.inverse_kinematics(*DISPENSER, tool=dispenser)
+    return override / number * 1e6, handle / number * 1e6, identical
+
+
+if __name__ == '__main__':
+    for ikcache in [0, 1024]:
+        override, handle, identical = run(ikcache)
+        print('%s:\toverride %.2f us, tool handle %.2f us per solution (%.1fx, %s)' % (
+            'cached' if ikcache else 'uncached', override, handle, override / handle,
+            'identical' if identical else 'DIFFERENT'))
@@ -0,0 +1,497 @@
+"""
+An asyncio version of the communicator for use inside an event loop
+
+The command table, command encoding, movement planning and kinematics are shared with Communicator. Responses
+are read by a reader registered on the event loop (or a background read task for transports without a file
+descriptor), and commands are written by a writer thread, so neither awaiting a long robot move nor a slow port
+blocks other instruments being polled on the same loop. Every public method of Communicator which talks to the
+robot is a coroutine here.
+
+    n9 = AsyncCommunicator(port='/dev/ttyUSB0')
+    await n9.start()  # opens the port, registers the reader and homes the robot
+    await n9.goto({'x': -188.36, 'y': 200.585}, {3: 8700})
+    await n9.output('gripper', 1)
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from PyNR.dependencies._communicator import Communicator, DriftError, FailedExecution, NoResponse, Preempted
+from PyNR.dependencies._journal import recover, track
+from PyNR.dependencies._transport import open_transport, Recorder, retry_delays
+from PyNR.dependencies.general import movetime
+
+
+class AsyncCommunicator(Communicator):
+    def __init__(self, **kwargs):
+        """
+        Accepts the same keyword arguments as Communicator. The robot is not homed until start() is awaited.
+
+        Step-cycle mode is not supported (it would block the event loop), and neither is threaded mode (the event
+        loop owns the port).
+        """
+        if kwargs.get('threaded', False) is True:
+            raise ValueError('The asyncio communicator cannot be threaded (the event loop owns the port).')
+        homeinitialize = kwargs.pop('homeinitialize', True)
+        super(AsyncCommunicator, self).__init__(homeinitialize=False, **kwargs)  # open the port without homing
+        self.kw['homeinitialize'] = homeinitialize
+        self.pending = deque()  # (packaged command, validate, future, time issued) for each command awaiting acknowledgement
+        self.loop = None  # the event loop the communicator is running on
+        self.readtask = None  # read task for transports which do not provide a file descriptor
+        self.writer = None  # the thread writing to the port, so that writes never block the event loop
+        self.resumed = None  # set while commands may be written (cleared by hold)
+        self.stops = 0  # number of stops requested (commands waiting to be written are preempted by a stop)
+
+    async def calculate_offset(self, x, y):
+        """calculates the offset of the current position from the provided x and y"""
+        cur_pos = self.forward_kinematics(await self.position())  # calculate current position by forward kinematics
+        return {'x': x - cur_pos['x'], 'y': y - cur_pos['y']}
+
+    async def confirm(self, wait=True):
+        """
+        returns the time until the commands in flight were acknowledged (or a task for it if wait is False)
+
+        The commands already written are never recalled, so a stop or hold is confirmed once they have finished.
+        """
+        start = time.perf_counter()
+
+        async def confirmed():
+            await self.drain()
+            latency = time.perf_counter() - start
+            if self.metrics is not None:
+                self.metrics.preemption.record(int(latency * 1e6))
+            return latency
+
+        if wait is False:
+            return self.loop.create_task(confirmed())
+        return await confirmed()
+
+    def connect(self, attempts=3):
+        """the port is opened by start() so that connecting does not block the event loop"""
+        return None
+
+    async def disconnect(self, roughhome=True):
+        """disconnects from the robot"""
+        if roughhome is True:  # roughly home the robot for faster initialization later
+            await self.roughhome()
+        await self.drain()
+        if self.kw['statefile'] is not None:  # save the axis counts for a warm start
+            self.savestate()
+        if self.kw['verbose']:
+            print('Disconnecting')
+        if self.readtask is not None:
+            self.readtask.cancel()
+        else:
+            self.loop.remove_reader(self.sercon.fileno())
+        if self.writer is not None:
+            self.writer.shutdown()
+        self.sercon.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    async def drain(self):
+        """waits for every command in flight to be acknowledged and returns the last acknowledgement"""
+        output = None
+        while len(self.pending) != 0:
+            output = await self.wait(self.pending[-1][2])
+        return output
+
+    async def execute(self, cmd, *args, validate=False, timeout=None, **kwargs):
+        """
+        Executes the specified command and returns its acknowledgement (see Communicator.execute)
+
+        timeout: the time to wait for the acknowledgement in seconds (defaults to the acktimeout keyword)
+        """
+        future = await self.submit(cmd, *args, validate=validate, **kwargs)
+        if future is None:  # offline mode
+            return None
+        return await self.wait(future, timeout)
+
+    def expire(self, future):
+        """fails the commands in flight up to the one of the future, as their acknowledgements did not arrive in time"""
+        if not any(pending[2] is future for pending in self.pending):
+            return None
+        self.stale = True
+        while True:
+            data, validate, pending, issued = self.pending.popleft()
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            if self.journal is not None:
+                self.journal.failed()
+            if pending.done() is False:
+                pending.set_exception(NoResponse(self.unpkg(data), self.kw['verbose']))
+                pending.exception()  # the waiting caller raises its own NoResponse
+            if pending is future:
+                return None
+
+    async def goto(self, *args, **kwargs):
+        """go to the provided position location (see Communicator.goto)"""
+        if len(args) == 1:  # only one argument has been handed
+            if type(args[0]) != dict:
+                raise ValueError('The goto function must be handed a dictionary.')
+            posdct = args[0]
+        elif len(args) == 2 and type(args[0]) == int and type(args[1]) == int:  # if handed an axis and a value
+            posdct = {args[0]: args[1]}
+        else:  # handles multiple dictionaries and will execute them in the sequence provided
+            for i in args:
+                if type(i) != dict:
+                    raise ValueError('Goto arguments may be either a dictionary or a list of dictionaries.')
+                await self.goto(i)
+            return None
+
+        futures = []
+        for cmd, cmdargs in self.plan(posdct, **kwargs):  # up to sendahead moves are streamed at once
+            futures.append(await self.submit(cmd, *cmdargs))
+        for future in futures:
+            if future is not None:
+                await self.wait(future)
+        self.loc.update(posdct)  # update the axes locations
+
+    async def hold(self, wait=True):
+        """
+        holds the commands submitted afterwards until release is called (see Communicator.hold)
+
+        Returns the time until the commands in flight were acknowledged (or a task for it if wait is False).
+        """
+        self.held = True
+        self.resumed.clear()
+        return await self.confirm(wait)
+
+    async def home(self, axes=None):
+        """homes the robot (see Communicator.home)"""
+        if axes is not None:
+            await self.goto({axis: 0 for axis in axes})
+            return None
+        if self.kw['verbose']:
+            print('Homing the robot')
+        await self.drain()  # acknowledgements of earlier commands must not be mistaken for the home response
+        await asyncio.sleep(self.waittime('home', ()))
+        future = await self.send(self.pkg('HOME'))
+        self.loc.update({0: 0, 1: 0, 2: 0, 3: 0, })
+        return await self.wait(future, 100)  # a full homing cycle can take a while
+
+    def keyboard(self):
+        """keyboard driving mode is not supported (it would block the event loop)"""
+        raise ValueError('Keyboard driving mode is not supported by the asyncio communicator.')
+
+    def onreadable(self, data=None):
+        """reads whatever is waiting on the port (unless data is provided) and hands completed frames to the waiting commands"""
+        if data is None:
+            data = self.sercon.read(max(1, self.sercon.in_waiting))
+        if self.metrics is not None:
+            self.metrics.read += len(data)
+        self.decoder.feed(data)
+        frame = self.decoder.frame()
+        while frame is not None:
+            if len(self.pending) != 0:  # frames nobody is waiting for are dropped
+                data, validate, future, issued = self.pending.popleft()
+                if self.metrics is not None:
+                    self.metrics.command(data, time.perf_counter() - issued)
+                if self.journal is not None:
+                    self.journal.acknowledged()
+                output = frame.decode('ascii')
+                if future.done() is True:  # the caller stopped waiting for this response
+                    pass
+                elif validate is True and self.errorcheck(self.unpkg(data), output) is False:
+                    future.set_exception(FailedExecution(self.unpkg(data), 'input does not match pingback: %s' % output))
+                else:
+                    if self.kw['shadow'] is True:
+                        self.observe(data, output)
+                    future.set_result(output)
+            frame = self.decoder.frame()
+
+    async def open(self):
+        """opens the transport (see Communicator.connect) and retries without blocking the event loop"""
+        if self.kw['transport'] is not None:  # use the provided transport
+            return self.kw['transport']
+        from serial import SerialException  # import pyserial
+        port = self.kw['port'] if self.kw['port'] is not None else self.kw['comport']
+        if self.kw['verbose']:
+            print('Connecting to the robot on %s' % port)
+        for delay in retry_delays(self.kw['connectionattempts']):
+            await asyncio.sleep(delay)
+            try:
+                return await self.loop.run_in_executor(
+                    None, open_transport, port, self.kw['baudrate'], self.kw['timeout'])
+            except SerialException as e:
+                error = e
+                if self.metrics is not None:
+                    self.metrics.retries += 1
+        print(
+            'A connection could not be established with the robot. Switching to offline mode. Communication error:\n%s' % error)
+        self.kw['offline'] = True
+
+    async def output(self, axis, value, sleep=None, force=False):
+        """sets the output axis to the specified value (see Communicator.output)"""
+        if type(axis) == str:  # catches if a string axis was provided (mapped by robot_paramaters.py output dictionary)
+            axis = self.ops[axis]
+        if force is False and self.outputs.get(axis) == value:
+            return None
+        try:
+            await self.execute('output', axis, value)
+        except Exception:
+            self.outputs.pop(axis, None)
+            raise
+        self.outputs[axis] = value
+        settle = self.settle.get(axis, (0.2, None))[0] if sleep is None else sleep
+        self.settling[axis] = time.monotonic() + settle
+
+    async def pickup(self, item):
+        """picks up the specified item (see Communicator.pickup)"""
+        if repr(item).startswith('Vial') is False:
+            # TODO code the pickup of a non-vial object
+            raise ValueError("Pickups of non-vial objects haven't been coded yet")
+        xy = {'x': item.location['x'], 'y': item.location['y']}
+        z = {'z': item.location['z'] + item.p['height'] - item.p['capheight']}  # offset by height and cap height
+        await self.goto(xy)
+        await self.goto(z)
+        await self.output('gripper', 1)  # engage the gripper
+        self.in_gripper = item  # put the item in the gripper variable
+        if self.journal is not None:
+            self.journal.gripper(item)
+        await self.goto({'z': self.kw['safeheight']})  # go to safe height
+
+    async def place(self, position):
+        """place the held item in the specified location (see Communicator.place)"""
+        if self.in_gripper is None:
+            raise ValueError('This communicator instance is not aware of any item currently held in the gripper.')
+        await self.goto(position, order='sez')  # go to the position
+        await self.output('gripper', 0)  # release the item
+        out = position
+        if repr(self.in_gripper).startswith('Vial'):  # if a Vial object
+            out = self.in_gripper
+            out.location.update(position)  # update the vial's position
+            if self.journal is not None:
+                self.journal.item(out)
+        self.in_gripper = None
+        if self.journal is not None:
+            self.journal.gripper(None)
+        return out  # the vial object or the position
+
+    async def position(self, refresh=False):
+        """get the position of of the robot (see Communicator.position)"""
+        if self.kw['shadow'] is True and self.kw['offline'] is False:
+            await self.drain()  # the shadow state follows the acknowledgements
+            period = self.kw['reconcileperiod']
+            if refresh is False and self.stale is False and (
+                    period is None or time.monotonic() - self.reconciled < period):
+                return dict(self.shadow)
+            return await self.reconcile()
+        output = await self.execute('position')
+        if output is not None:
+            self.loc = self.parseloc(output)
+        return self.loc
+
+    async def reconcile(self):
+        """reads the axis counts from the robot and checks them against the shadow state (see Communicator.reconcile)"""
+        self.drift = None
+        await self.execute('position')
+        self.loc.update(self.shadow)
+        if self.drift is not None:
+            drift = self.drift
+            self.drift = None
+            raise DriftError(drift)
+        return dict(self.shadow)
+
+    async def readloop(self):
+        """reads the port from a worker thread (for transports which do not provide a file descriptor)"""
+        self.sercon.timeout = 0.1
+        while True:
+            data = await self.loop.run_in_executor(None, lambda: self.sercon.read(max(1, self.sercon.in_waiting)))
+            self.onreadable(data)  # futures are only resolved on the event loop thread
+
+    def release(self):
+        """writes the commands held by hold"""
+        self.held = False
+        self.resumed.set()
+
+    async def resume(self, tray=None, reissue=True):
+        """restores the state recorded in the journal after a crash (see Communicator.resume)"""
+        if self.journal is None:
+            raise ValueError('A journal path must be provided (journal keyword) to resume a run.')
+        state = recover(self.kw['journal'])
+        self.loc.update(state.loc)
+        self.stale = True
+        vials = state.apply(tray) if tray is not None else {}
+        self.in_gripper = vials.get(state.gripper, state.gripper)
+        if reissue is True and self.kw['offline'] is False:
+            for n, command in zip(state.sequences, state.pending):
+                await self.send(self.pkg(command))
+                self.journal.resolved(n)
+            await self.drain()
+            for command in state.pending:
+                track(self.loc, state.outputs, command)
+            state.pending = []
+            state.sequences = []
+        self.outputs.update(state.outputs)
+        return state
+
+    async def roughhome(self):
+        """roughly homes the robot for faster initialization"""
+        if self.kw['verbose']:
+            print('Rough homing the robot')
+        if self.kw['homeinitialize'] is True:
+            acc = 150000
+            vel = 10000
+            await self.execute('movesync', 0, 3,  # home gripper and z
+                               0,
+                               10,
+                               acc, vel)
+            self.loc.update({0: 0, 3: 10})
+            await self.execute('movesync', 1, 2,  # home shoulder and elbow
+                               100,
+                               100,
+                               acc,
+                               vel)
+            self.loc.update({1: 100, 2: 100})
+
+    async def send(self, data, validate=False):
+        """
+        writes packaged command bytes and returns a future for the acknowledgement (see submit)
+
+        Waits while the commands are held and for a free slot in the window. A command in flight which is not
+        acknowledged within acktimeout leaves the window (it fails with NoResponse). The command fails with
+        Preempted if a stop is requested before it is written.
+        """
+        stops = self.stops
+        while self.held is True and self.stops == stops:  # set aside until released
+            await self.resumed.wait()
+        while len(self.pending) >= self.kw['sendahead'] and self.stops == stops:  # the window is full
+            oldest = self.pending[0]
+            remaining = oldest[3] + self.kw['acktimeout'] - time.perf_counter()
+            done = (await asyncio.wait([oldest[2]], timeout=max(remaining, 0.)))[0]
+            if len(done) == 0:  # the robot went quiet
+                self.expire(oldest[2])
+        if self.stops != stops:
+            raise Preempted(self.unpkg(data))
+        if self.kw['verbose']:
+            print("Executing command '%s'" % self.unpkg(data))
+        future = self.loop.create_future()
+        entry = (data, validate, future, time.perf_counter())
+        self.pending.append(entry)
+        if self.journal is not None:
+            self.journal.issued(self.unpkg(data))
+        try:
+            await self.loop.run_in_executor(self.writer, self.sercon.write, data)  # in order, off the event loop
+        except Exception:
+            self.stale = True
+            if entry in self.pending:
+                self.pending.remove(entry)
+                if self.journal is not None:
+                    self.journal.failed()
+            raise
+        if self.metrics is not None:
+            self.metrics.written += len(data)
+        return future
+
+    async def spin(self, time=60, v=25000, wait=False):
+        """spins the gripper for the specified amount of time (see Communicator.spin)"""
+        endcounts = self.loc[0] + int(time * v)
+        await self.execute('spin', 0, endcounts, a=50000, v=v)
+        self.busy[0] = self.t.monotonic() + movetime(endcounts - self.loc[0], v, 50000)
+        self.loc.update({0: endcounts})
+        if wait is True:
+            await self.waitfor(0)
+
+    async def start(self):
+        """connects to the robot, starts reading from it on the running event loop and homes the robot if requested"""
+        self.loop = asyncio.get_running_loop()
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        if self.kw['offline'] is False:
+            self.sercon = await self.open()
+        if self.kw['offline'] is True:
+            return None
+        if self.kw['record'] is not None:  # log everything written to and read from the robot
+            self.sercon = Recorder(self.sercon, self.kw['record'])
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='NR9 writer')  # one thread keeps the order
+        try:
+            fileno = self.sercon.fileno()
+        except (AttributeError, NotImplementedError):
+            fileno = None
+        if fileno is None:
+            self.readtask = self.loop.create_task(self.readloop())
+        else:
+            self.sercon.timeout = 0  # reads only return what is already waiting
+            self.loop.add_reader(fileno, self.onreadable)
+        if self.kw['homeinitialize'] is True:
+            if await self.warmstart() is False:  # home the robot unless the saved axis counts can be trusted
+                await self.home()
+
+    async def stop(self, wait=True):
+        """
+        stops the robot as soon as possible (see Communicator.stop)
+
+        Every command waiting to be written (held or waiting for a slot in the window) fails with Preempted.
+        Returns the time until the commands in flight were acknowledged (or a task for it if wait is False).
+        """
+        self.stops += 1
+        self.resumed.set()  # wake the held commands so they can fail
+        if self.held is True:
+            self.resumed = asyncio.Event()  # commands submitted afterwards are still held
+        return await self.confirm(wait)
+
+    async def submit(self, cmd, *args, validate=False, **kwargs):
+        """
+        writes a command without waiting for its acknowledgement and returns a future for the acknowledgement
+
+        Waits for a free slot if sendahead commands are already in flight.
+        """
+        data = self.encode(cmd, *args, **kwargs)
+        wait = self.waittime(cmd, args)
+        if wait > 0.:  # an axis is still spinning or depends on an output which is still settling
+            await asyncio.sleep(wait)
+        if self.kw['offline'] is True:  # if offline mode is enabled, don't actually execute anything
+            return None
+        future = await self.send(data, validate)
+        for axis in self.resources(cmd, args):  # track completion per axis
+            self.using[axis] = future
+        return future
+
+    async def test(self, repeats=1):
+        """tests communication with the robot (see Communicator.test)"""
+        if self.kw['verbose']:
+            print('Executing test functions')
+        for i in range(repeats):
+            print(repr(await self.execute('echo')))  # echos the robot
+            print(repr(await self.execute('random')))  # grabs a random number
+            print(repr(await self.execute('plustwo', i + 1)))  # returns the iteration plus 2
+
+    async def waitfor(self, *resources):
+        """waits until the provided axes and outputs are free (see Communicator.waitfor)"""
+        for resource in resources:
+            if type(resource) == str:  # an output
+                settled = self.settling.get(self.ops[resource])
+                if settled is not None:
+                    await asyncio.sleep(max(settled - time.monotonic(), 0.))
+                continue
+            future = self.using.get(resource)
+            if future is not None and future.done() is False:
+                await self.wait(future)
+            free = self.busy.get(resource)
+            if free is not None:
+                await asyncio.sleep(max(free - time.monotonic(), 0.))
+
+    async def warmstart(self):
+        """restores the axis counts saved on the last clean disconnect (see Communicator.warmstart)"""
+        stored = self.loadstate()
+        if stored is None:
+            return False
+        reported = await self.position(refresh=True)
+        for axis in stored:
+            if abs(reported.get(axis, 0) - stored[axis]) > self.kw['statetolerance']:
+                return False
+        return True
+
+    async def wait(self, future, timeout=None):
+        """waits for the acknowledgement future of a submitted command"""
+        if timeout is None:
+            timeout = self.kw['acktimeout']
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.stale = True
+            data = [pending[0] for pending in self.pending if pending[2] is future]
+            self.expire(future)  # later acknowledgements must not be matched to this command
+            raise NoResponse(self.unpkg(data[0]) if len(data) != 0 else None, self.kw['verbose'])
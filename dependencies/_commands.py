@@ -98,4 +98,54 @@ commands = {
     'nargs': 0,
     'va': False,
     },
-}
\ No newline at end of file
+}
+
+
+class Encoder(object):
+    def __init__(self, key, cmddct, acceleration, velocity):
+        """
+        a pre-validated encoder for a single command of the commands dictionary
+
+        The packaged byte templates ('<CMND V1[%d] V2[%d]\\r') are built once, so encoding a command is a
+        single bytes formatting operation.
+
+        key: the command key (e.g. 'move')
+
+        cmddct: the commands dictionary entry for the command
+
+        acceleration, velocity: the defaults appended when they are not provided for a 'va' command
+        """
+        self.key = key
+        self.cmd = cmddct['CMD']
+        self.nargs = cmddct['nargs']
+        self.va = cmddct['va']
+        self.a = acceleration
+        self.v = velocity
+        self.template = b'<' + self.cmd.encode('ascii')
+        for i in range(self.nargs):
+            self.template += b' V%d[%%d]' % (i + 1)
+        self.template += b'\r'
+
+    def __call__(self, *args, a=None, v=None):
+        """encodes the arguments into a packaged command (bytes ready to be written to the robot)"""
+        nargs = len(args)
+        if nargs != self.nargs:  # if an incorrect number of arguments were provided
+            if self.va is True and nargs == self.nargs - 2:  # if velocity and acceleration were skipped
+                args += (self.a if a is None else a, self.v if v is None else v)
+            elif self.va is True and nargs == self.nargs - 1:  # if velocity was skipped
+                args += (self.v if v is None else v,)
+            else:
+                raise ValueError(
+                    'An incorrect number of variable arguments were passed for the function %s\n'
+                    '(expected: %d, passed: %d)'
+                    % (self.key, self.nargs, nargs)
+                )
+        return self.template % tuple(map(round, args))
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.cmd)
+
+
+def compile_commands(commands, acceleration, velocity):
+    """creates an Encoder for every command in the provided commands dictionary"""
+    return {key: Encoder(key, commands[key], acceleration, velocity) for key in commands}
@@ -11,6 +11,26 @@ Also include a set of basic movement/sequences to accomplish a given task (uncap
 
 Look up buffer check
 """
+from collections import deque
+from concurrent.futures import Future
+import functools
+import itertools
+import json
+import operator
+import os
+import queue
+import threading
+
+from PyNR.dependencies._framing import FrameDecoder, POSITION
+from PyNR.dependencies._journal import Journal, recover, track
+from PyNR.dependencies._metrics import Metrics
+from PyNR.dependencies._transport import open_transport, Recorder, retry_delays
+from PyNR.dependencies.general import movetime
+
+URGENT = 0  # priority of stop and hold confirmations (written ahead of everything else)
+NORMAL = 10  # default priority of submitted commands
+BACKGROUND = 20  # priority of low priority work (written when nothing else is queued)
+KINEMATICS = ('sh_el', 'el_gr', 'sh_cpr', 'el_cpr', 'sh_zero', 'el_zero', 'x_offset', 'y_offset')  # parameters of the kinematics
 
 
 class NoResponse(Exception):
@@ -34,6 +54,30 @@ class FailedExecution(Exception):
             'The command %s failed to execute. \nError message: %s' % (self.command, self.error))
 
 
+class Preempted(Exception):
+    def __init__(self, command):
+        """raised for a queued command which was dropped by a stop before it was written to the robot"""
+        self.command = command
+        super(Preempted, self).__init__('The command %s was preempted before it was executed.' % command)
+
+
+class DriftError(Exception):
+    def __init__(self, drift):
+        """raised when the axis counts reported by the robot differ from the acknowledged moves"""
+        self.drift = drift  # (expected, reported) counts of each axis which drifted
+        super(DriftError, self).__init__(
+            'The robot reports axis counts which differ from the acknowledged moves (%s)' % ', '.join(
+                'axis %d: expected %d, reported %d' % (axis, expected, reported)
+                for axis, (expected, reported) in sorted(drift.items())))
+
+
+class UnreachableTarget(ValueError):
+    def __init__(self, target, reason='no elbow configuration reaches it within the joint ranges'):
+        """raised for a target the arm cannot reach, before any command is sent to the robot"""
+        self.target = target  # the position dictionary (or description) of the target
+        super(UnreachableTarget, self).__init__('The target %s cannot be reached: %s.' % (target, reason))
+
+
 class InvalidCommand(Exception):
     def __init__(self, command):
         super(InvalidCommand, self).__init__("The specified command ('%s') is not recognized." % command)
@@ -44,18 +88,37 @@ class Communicator(object):
         self.kw = {  # keyword arguments to adjust the behaviour of the communicator class instance
             'baudrate': 115200,  # used for serial communication
             'comport': 6,  # serial communication port
+            'port': None,  # device path or pyserial URL of the robot (e.g. '/dev/ttyUSB0', 'socket://host:port'; overrides comport)
+            'transport': None,  # an already opened transport to use instead of opening a port (e.g. a stand-in for testing)
+            'journal': None,  # path of a crash-recovery journal of the commands and item state changes (see _journal.py and resume)
+            'metrics': False,  # whether to record per-command latency histograms and byte/retry counters (see _metrics.py)
+            'record': None,  # path of a binary log to record the session to (can be replayed with _transport.ReplayTransport)
             'timeout': 1,  # used for serial communication
+            'acktimeout': 60,  # time to wait for a command to be acknowledged in seconds (moves are acknowledged when they finish)
             'verbose': False,  # used to make the debug output really chatty
             'offline': False,  # bool for offline mode (will not activate any com ports)
             'stepcycle': False,  # whether step-cycle mode is enabled (this requires user input before execution is completed)
             'connectionattempts': 3,  # number of attempts to connect to the robot
             'homeinitialize': True,  # whether to home the robot upon initialization
+            'statefile': None,  # path the axis counts are saved to on disconnect, so the next start can skip homing (see warmstart)
+            'stateage': 86400,  # saved axis counts older than this (s) are not trusted
+            'statetolerance': 5,  # largest difference (counts) between the saved and reported axis counts for a warm start
             'velocity': 10000,  # velocity (counts/s)
             'acceleration': 75000,  # acceleration
+            'anglechoice': 'shoulder',  # how chooseangle picks the elbow configuration: 'shoulder' (closest shoulder count) or 'time' (fastest move)
+            'ikcache': 1024,  # number of inverse kinematics solutions kept (least recently used are dropped; 0 disables the cache)
             'safeheight': None,  # safe height for operations (height were object collisions will be avoided)
+            'reachcache': os.path.join(os.path.expanduser('~'), '.cache', 'PyNR'),  # directory reachability maps are saved to (None: built every session)
+            'tools': {},  # kinematic overrides by tool name, added to robot_parameters.tools (e.g. {'pipette': {'el_gr': 190.}})
+            'settle': {},  # settle times by output name, overriding robot_parameters.settle (e.g. {'gripper': {'time': 0.1, 'axes': [0, 1, 2, 3]}})
+            'sendahead': 1,  # commands that may be in flight before waiting for an acknowledgement (1 is stop-and-wait, do not exceed the firmware command buffer depth)
+            'shadow': False,  # whether position() is served from the acknowledged axis counts instead of a POSR round trip (see reconcile)
+            'reconcileperiod': 60.,  # longest time (s) between POSR reconciliations of the shadow state (None: only after errors or on demand)
+            'drifttolerance': 10,  # largest difference (counts) between the shadow state and a POSR before DriftError is raised
+            'threaded': False,  # whether a dedicated I/O thread owns the serial port (submit then returns futures and the instance may be shared between threads)
         }
 
-        from PyNR.dependencies.robot_parameters import params, outputs, \
+        from PyNR.dependencies.robot_parameters import params, outputs, settle, tools, \
             components  # load robot parameters and update the keywords with them
         self.kw.update(params)
 
@@ -73,21 +136,67 @@ class Communicator(object):
             raise KeyError('Unsupported keyword argument(s): %s' % string)
         self.kw.update(kwargs)  # update defaults with provided keyword arguments
 
-        self.math = __import__('math')
-        from PyNR.dependencies._commands import commands  # import commands dictionary from _commands.py
+        settletimes = dict(settle)
+        settletimes.update(self.kw['settle'])
+        self.settle = {}  # settle time and dependent axes of each output
+        for key in outputs:
+            entry = settletimes.get(outputs[key], settletimes[None])
+            self.settle[key] = (entry['time'], frozenset(entry['axes']))
+        self.settling = {}  # time at which each recently set output will have settled
+        self.busy = {}  # time at which the background motion (spin) of each axis will have finished
+        self.using = {}  # future of the last command submitted for each axis (threaded mode)
+
+        from PyNR.dependencies.head_modules import FIELDS
+        self.calibration = operator.itemgetter(*FIELDS)  # the kinematic parameters of the keywords (see profiles)
+        self.toolparams = dict(tools, **self.kw['tools'])  # kinematic overrides of each tool by name
+        self.profile = None  # kinematics of the bare arm
+        self.tools = {}  # kinematic profile of each tool by name (see tool)
+        self.profiles()
+        self.reachmaps = {}  # reachability map of each kinematic profile (see reachability)
+        if self.kw['ikcache'] > 0:  # memoize the inverse kinematics (statistics from self.ikcache.cache_info())
+            self.ikcache = functools.lru_cache(maxsize=self.kw['ikcache'])(self.solve)
+        else:
+            self.ikcache = self.solve
+        from PyNR.dependencies._commands import commands, \
+            compile_commands  # import commands dictionary from _commands.py
         self.commands = commands
+        self.encoders = compile_commands(commands, self.kw['acceleration'], self.kw['velocity'])  # one encoder per command (the default velocity and acceleration are fixed here)
 
         self.t = __import__('time')  # time function for wait commands
-        self.va = {'v': self.kw['velocity'],
-                   'a': self.kw['acceleration']}  # package the default velocity and acceleration
 
+        self.decoder = FrameDecoder()  # incremental decoder for response frames
+        self.inflight = deque()  # commands written (or buffered) which have not been acknowledged yet
+        self.wbuf = bytearray()  # buffered commands which have not been written yet
+        self.unsent = 0  # number of commands in the write buffer
+        self.requests = queue.PriorityQueue()  # (priority, sequence, command) waiting for the I/O thread (threaded mode)
+        self.sequence = itertools.count()  # keeps commands of the same priority in the order they were queued
+        self.lastfuture = None  # future of the queued command which will be written last (threaded mode)
+        self.lastkey = None  # (priority, sequence) of lastfuture
+        self.held = False  # whether only urgent commands are written (see hold)
+        self.parked = deque()  # queued commands set aside while held
+        self.preempt = threading.Event()  # set by stop to have the I/O thread drop the queued commands
+        self.iothread = None
+        self.metrics = Metrics() if self.kw['metrics'] is True else None  # latency histograms and counters
+        self.journal = Journal(self.kw['journal']) if self.kw['journal'] is not None else None  # crash-recovery journal
         self.loc = {}
+        self.shadow = {}  # axis counts after the acknowledged moves (shadow mode)
+        self.outputs = {}  # output states after the acknowledged output commands (see output)
+        self.stale = True  # whether the shadow state must be reconciled before it is trusted
+        self.reconciled = None  # time of the last reconciliation
+        self.drift = None  # drift found by the last reconciliation
+        if self.kw['offline'] is False:
+            self.sercon = self.connect(self.kw['connectionattempts'])  # connect to the robot
         if self.kw['offline'] is True:
             print('OFFLINE MODE IS ACTIVE')
         else:
-            self.sercon = self.connect(self.kw['connectionattempts'])  # connect to the robot
+            if self.kw['record'] is not None and self.sercon is not None:  # log everything written to and read from the robot (the asyncio communicator opens its port in start)
+                self.sercon = Recorder(self.sercon, self.kw['record'])
+            if self.kw['threaded'] is True:  # hand the port over to the I/O thread
+                self.iothread = threading.Thread(target=self.ioloop, name='NR9 I/O', daemon=True)
+                self.iothread.start()
             if self.kw['homeinitialize'] is True:
-                self.home()  # home the robot
+                if self.warmstart() is False:  # home the robot unless the saved axis counts can be trusted
+                    self.home()
         self.in_gripper = None,  # holder for object in the robot's gripper (default empty)
         # self.loc = { # location tracker for the robot
         #     0: 0, # gripper rotation
@@ -99,13 +208,51 @@ class Communicator(object):
         #     # 6: 0, # unassigned
         #     }
 
+    def acknowledge(self):
+        """reads the acknowledgement of the oldest command in flight and error checks it"""
+        try:
+            output = self.read()  # retrieve the output and error check
+        except NoResponse:  # give up on the command so later acknowledgements are matched to their own commands
+            data, validate, future, deadline, issued = self.inflight.popleft()
+            if self.journal is not None:
+                self.journal.failed()
+            self.stale = True
+            raise NoResponse(self.unpkg(data), self.kw['verbose'])
+        return self.complete(output)
+
     def calculate_offset(self, x, y):
         """calculates the offset of the current position from the provided x and y"""
         cur_pos = self.forward_kinematics(self.position())  # calculate current position by forward kinematics
         return {'x': x - cur_pos['x'], 'y': y - cur_pos['y']}
 
-    def chooseangle(self, options):
-        """chooses the closest shoulder angle to the current shoulder position"""
+    def chooseangle(self, options, mode=None):
+        """
+        chooses between the elbow configurations of inverse_kinematics
+
+        mode: 'shoulder' chooses the closest shoulder angle to the current shoulder position. 'time' chooses the
+        configuration within the joint ranges whose move is predicted to finish first (the shoulder and elbow
+        move together, so the slower of the two travels at the velocity and acceleration keywords decides; see
+        general.movetime). Defaults to the anglechoice keyword.
+        """
+        if mode is None:
+            mode = self.kw['anglechoice']
+        if mode == 'time':
+            best = None
+            for dct in options:
+                if any(not self.kw['ranges'][axis][0] <= dct[axis] <= self.kw['ranges'][axis][1] for axis in [1, 2]):
+                    continue
+                score = (  # predicted move time, ties go to the closest shoulder
+                    max(movetime(dct[axis] - self.loc[axis], self.kw['velocity'], self.kw['acceleration'])
+                        for axis in [1, 2]),
+                    abs(dct[2] - self.loc[2]),
+                )
+                if best is None or score < best[0]:
+                    best = (score, dct)
+            if best is None:
+                raise ValueError('No solution for this point could be determined (both configurations are outside the joint ranges).')
+            return best[1]
+        if mode != 'shoulder':
+            raise ValueError("The angle choice mode must be 'shoulder' or 'time', not %s." % mode)
         shlist = []
         for dct in options:
             if dct[2] < 0:  # ignore if value less than 0
@@ -120,40 +267,204 @@ class Communicator(object):
             if dct[2] == shlist[ind]:  # if the shoulder value matches the closest one, return
                 return dct
 
+    def checkreach(self, posdct, tool=None, **kwargs):
+        """
+        checks that a position dictionary is within the joint limits, without moving the robot
+
+        Axis counts are checked against the ranges and x, y coordinates against the reachability map of the tool
+        (keyword arguments override its kinematic parameters as for inverse_kinematics). Use it to reject the
+        targets of a protocol before starting it.
+
+        returns the configurations of inverse_kinematics which reach the x, y coordinates (() if none are given)
+        """
+        for axis in self.kw['ranges']:
+            if axis in posdct and not (axis in [1, 2] and 'x' in posdct):  # counts from x, y are checked below
+                if not self.kw['ranges'][axis][0] <= posdct[axis] <= self.kw['ranges'][axis][1]:
+                    raise UnreachableTarget(posdct, 'axis %d would be outside its range %s' % (
+                        axis, self.kw['ranges'][axis]))
+        if 'x' not in posdct:
+            return ()
+        if 'y' not in posdct:
+            raise ValueError('If x is provided, y must also be provided.')
+        profile = self.tool(tool)
+        if len(kwargs) != 0:
+            profile = profile.derive(**kwargs)
+        configurations = self.reachability(profile).lookup(posdct['x'], posdct['y'])
+        if len(configurations) == 0:
+            raise UnreachableTarget(posdct)
+        return configurations
+
+    def complete(self, output):
+        """matches a received acknowledgement to the oldest command in flight and error checks it"""
+        data, validate, future, deadline, issued = self.inflight.popleft()
+        if self.metrics is not None:
+            self.metrics.command(data, self.t.perf_counter() - issued)
+        if self.journal is not None:
+            self.journal.acknowledged()
+        error = None
+        if validate is True: # if return validation is called for
+            strcmd = self.unpkg(data)
+            if self.errorcheck(strcmd, output) is False:
+                # TODO should the command resend?
+                error = FailedExecution(strcmd, 'input does not match pingback: %s' % output)
+        if error is not None:
+            self.stale = True
+        elif self.kw['shadow'] is True:
+            self.observe(data, output)
+        if future is not None:  # threaded mode, hand the result to the waiting caller
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(output)
+            return output
+        if error is not None:
+            raise error
+
+        if self.kw['stepcycle'] is True:  # if step-cycle mode is enabled
+            input('Command %s executed successfully, continue?' % self.unpkg(data))
+        return output
+
+    def confirm(self, wait=True):
+        """writes an urgent echo and returns the time until it was acknowledged (or a future for it if wait is False)"""
+        start = self.t.perf_counter()
+        future = self.enqueue(self.pkg('ECHO'), priority=URGENT)
+
+        def confirmed(future):
+            if self.metrics is not None and future.exception() is None:
+                self.metrics.preemption.record(int((self.t.perf_counter() - start) * 1e6))
+
+        future.add_done_callback(confirmed)
+        if wait is False:
+            return future
+        future.result()
+        return self.t.perf_counter() - start
+
     def connect(self, attempts=3):
         """
         attempts to connect to the robot
+
+        The transport keyword is used as is if it was provided (e.g. a stand-in for testing). Otherwise the port
+        keyword (a device path or pyserial URL such as '/dev/ttyUSB0' or 'socket://host:port', see _transport.py)
+        or the comport keyword is opened. Failed attempts are retried with an increasing delay.
         
         If you cannot connect to the robot, install the FTDI drivers from 
         http://www.ftdichip.com/Drivers/VCP.htm
         (the easiest way to do this is to use the executables)
         """
-        from serial import Serial, SerialException  # import pyserial
-        import time
+        if self.kw['transport'] is not None:  # use the provided transport
+            return self.kw['transport']
+        from serial import SerialException  # import pyserial
+        port = self.kw['port'] if self.kw['port'] is not None else self.kw['comport']
         if self.kw['verbose']:
-            print('Connecting to the robot on comport %d' % self.kw['comport'])
-        attempt = 1
-        while attempt < attempts:
+            print('Connecting to the robot on %s' % port)
+        for delay in retry_delays(attempts):
+            self.t.sleep(delay)
             try:
-                return Serial('COM' + str(self.kw['comport']),  # establish the serial connection
-                              baudrate=self.kw['baudrate'],
-                              timeout=self.kw['timeout'],
-                              )
+                return open_transport(port, self.kw['baudrate'], self.kw['timeout'])  # establish the connection
             except SerialException as e:
-                attempt += 1
-                time.sleep(1)
-                if attempt == attempts:
-                    print(
-                        'A connection could not be established with the robot. Switching to offline mode. Communication error:\n%s' % e)
-                    self.kw['offline'] = True
+                error = e
+                if self.metrics is not None:
+                    self.metrics.retries += 1
+        print(
+            'A connection could not be established with the robot. Switching to offline mode. Communication error:\n%s' % error)
+        self.kw['offline'] = True
+
+    def discard(self):
+        """drops buffered commands which have not been written to the robot yet"""
+        if self.kw['threaded'] is True:  # cancel everything still waiting for the I/O thread
+            while True:
+                try:
+                    entry = self.requests.get_nowait()
+                except queue.Empty:
+                    return None
+                if entry[2] is not None:
+                    entry[2][2].cancel()
+                else:  # keep a pending shut down request
+                    self.requests.put(entry)
+                    return None
+        for i in range(self.unsent):
+            self.inflight.pop()
+            if self.journal is not None:
+                self.journal.dropped()
+        del self.wbuf[:]
+        self.unsent = 0
 
     def disconnect(self, roughhome=True):
         """disconnects from the robot"""
         if roughhome is True:  # roughly home the robot for faster initialization later
             self.roughhome()
+        self.drain()  # wait for the last commands to be acknowledged
         if self.kw['verbose']:
             print('Disconnecting')
+        if self.kw['statefile'] is not None:  # save the axis counts for a warm start
+            self.savestate()
+        if self.iothread is not None:  # stop the I/O thread
+            self.requests.put((float('inf'), next(self.sequence), None))  # after everything else
+            self.wake()
+            self.iothread.join()
         self.sercon.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    def drain(self):
+        """
+        writes any buffered commands and waits for every command in flight to be acknowledged
+
+        returns the acknowledgement of the last command
+        """
+        if self.kw['threaded'] is True:  # wait for everything queued so far
+            if self.lastfuture is None:
+                return None
+            try:
+                return self.lastfuture.result()
+            except Preempted:  # dropped by a stop, nothing is left to wait for
+                return None
+        self.flush()
+        output = None
+        while len(self.inflight) != 0:
+            output = self.acknowledge()
+        return output
+
+    def encode(self, cmd, *args, **kwargs):
+        """
+        packages the specified command and arguments as bytes ready to be written to the robot
+
+        Velocity and acceleration are appended if they were skipped (see execute).
+        """
+        try:
+            encoder = self.encoders[cmd]  # retrieve the command encoder
+        except KeyError:
+            raise InvalidCommand(cmd)
+        return encoder(*args, **kwargs)
+
+    def enqueue(self, data, validate=False, timeout=None, priority=NORMAL):
+        """
+        queues packaged command bytes for the I/O thread and returns a future for the acknowledgement
+
+        priority: commands with a lower value are written first (see URGENT, NORMAL and BACKGROUND)
+        """
+        if timeout is None:
+            timeout = self.kw['acktimeout']
+        future = Future()
+        key = (priority, next(self.sequence))
+        if self.lastfuture is None or self.lastfuture.done() or key > self.lastkey:
+            self.lastfuture = future
+            self.lastkey = key
+        if self.metrics is not None:
+            self.metrics.depth.record(self.requests.qsize())
+        self.requests.put(key + ((data, validate, future, timeout),))
+        self.wake()
+        return future
+
+    def errorcheck(self, written, read):
+        """error checks the written string against the read string"""
+        read = read.strip()  # remove the trailing carriage return
+        if not read.startswith('<') or not read.endswith('>'): # if the command is not packaged properly
+            return False
+        elif read[1:-1] != written: # if the packaged execution does not match what was written
+            return False
+        else:
+            return True  # successful execution and return
 
     def execute(self, cmd, *args, validate=False, **kwargs):
         """
@@ -164,92 +475,65 @@ class Communicator(object):
         
         Velocity and acceleration are specified upon initiation of the class, 
         but can be passed to this function as keyword arguments 'v' and 'a' respectively. 
-        
-        """
-
-        # TODO update the errorcheck function to check for <executed_command>
-        def errorcheck(written, read):
-            """error checks the written string against the read string"""
-            if not read.startswith('<') or not read.endswith('>'): # if the command is not packaged properly
-                return False
-            elif read[1:-1] != written: # if the packaged execution does not match what was written
-                return False
-            else:
-                return True  # successful execution and return
-
-        def pseudorobot(written):
-            """pretends to be the robot in offline mode"""
-            return written + '>'
 
+        Any commands still in flight from pipelined submissions (see submit) are acknowledged first, and
+        the acknowledgement of this command is returned. In threaded mode, this blocks on the future
+        returned by submit.
+        """
         try:
-            try:
-                cmddct = self.commands[cmd]  # retrieve the command
-            except KeyError:
-                raise InvalidCommand(cmd)
-            if len(args) != cmddct['nargs']:  # if an incorrect number of arguments were provided
-                if len(args) >= cmddct['nargs'] - 2 and len(args) < cmddct['nargs'] and cmddct[
-                        'va'] is True:  # if velocity and acceleration were skipped
-                    args = list(args)
-                    largs = len(args)  # check the number of arguments
-                    va = dict(self.va) # retrieve instance velocity and acceration
-                    va.update(**kwargs) # update the velocity and acceleration
-                    # if largs != cmddct['nargs'] - 1:  # if acceleration was provided as an argument
-                    args.append(va['a']) # append acceleration
-                    args.append(va['v']) # append velocity
-
-                else:
-                    raise ValueError(
-                        'An incorrect number of variable arguments were passed for the function %s\n'
-                        '(expected: %d, passed: %d)'
-                        % (cmd, cmddct['nargs'], len(args))
-                    )
-            strcmd = cmddct['CMD'] # get the four letter command key
-            for i, v in enumerate(args):  # package variables
-                strcmd += ' V' + str(i + 1) + '[' + str(round(v)) + ']'
-            if self.kw['offline'] is True:  # if offline mode is enabled, don't actually execute anything
-                if self.kw['verbose'] is True:
-                    pseudorobot(strcmd)
-                    # print('executing %s with package %s' %(cmd,pkg))
-                return None
-
-            if self.kw['verbose']:
-                print("Executing command '%s'" % (strcmd))
-            self.sercon.write(self.pkg(strcmd))  # execute the string
-
-            output = self.read()  # retrieve the output and error check
-            if validate is True: # if return validation is called for
-                if errorcheck(strcmd, output) is False:
-                    # TODO should the command resend?
-                    raise FailedExecution(strcmd,'input does not match pingback: %s' %output)
-
-            if self.kw['stepcycle'] is True:  # if step-cycle mode is enabled
-                input('Command %s executed successfully, continue?' % cmd)
-
-            return output
+            future = self.submit(cmd, *args, validate=validate, **kwargs)
+            if future is not None:  # threaded mode
+                return future.result()
+            return self.drain()
 
         except KeyboardInterrupt:  # CTRL+C will break out of any execute command
             print('User interrupted exection')
+            self.discard()  # drop commands that have not been written yet
             self.home()  # send robot home
             raise KeyboardInterrupt
 
-    def forward_kinematics(self, dct=None, offset=False, **kwargs):
-        """converts a location dictionary to x,y,z coordinates"""
+    def flush(self):
+        """writes all buffered commands to the robot in a single write"""
+        if self.kw['threaded'] is True and threading.current_thread() is not self.iothread:
+            return None  # only the I/O thread writes to the port
+        if len(self.wbuf) != 0:
+            self.sercon.write(self.wbuf)
+            if self.metrics is not None:
+                self.metrics.written += len(self.wbuf)
+            del self.wbuf[:]
+            self.unsent = 0
+
+    def forward_kinematics(self, dct=None, offset=False, tool=None, **kwargs):
+        """
+        converts a location dictionary to x,y,z coordinates
+
+        offset: whether to apply the x and y offsets (the result is then the inverse of inverse_kinematics)
+
+        tool: the tool whose kinematics are used (see tool; the bare arm if None)
+
+        Keyword arguments override the kinematic parameters (e.g. el_gr for a different arm length).
+        """
         if dct is None:  # if a location dictionary was provided
             dct = self.loc
-        # TODO update this to accept keywords (for backcalculation of locations with different arm lengths)
-        sh = (dct[2] - self.kw['sh_zero']) / self.kw['sh_cpr'] * 2 * self.math.pi  # calculate the shoulder angle
-        el = (dct[1] - self.kw['el_zero']) / self.kw['el_cpr'] * 2 * self.math.pi * -1
-        # print('Shoulder angle (degrees):\t', self.math.degrees(sh))
-        # print('Elbow angle (degrees):\t', self.math.degrees(el))
-        # TODO figure out why x and y are reversed
-        x = self.kw['sh_el'] * self.math.cos(sh) + self.kw['el_gr'] * self.math.cos(sh + el)
-        y = self.kw['sh_el'] * self.math.sin(sh) + self.kw['el_gr'] * self.math.sin(sh + el)
-
+        profile = self.tool(tool)
+        if len(kwargs) != 0:
+            profile = profile.derive(**kwargs)
+        x, y = profile.forward(dct[2], dct[1])
         if offset is False: # if uncorrected values are desired
-            return {'x': -y, 'y': x}
-        else:
-            # TODO apply offset to values, (change offset kwarg to True when this is done)
-            pass
+            return {'x': x, 'y': y}
+        return {'x': x + profile.x_offset, 'y': y + profile.y_offset}
+
+    def forward_kinematics_array(self, counts, offset=False, tool=None, **kwargs):
+        """
+        converts an (N, axes) array of axis counts (column i holds axis i, e.g. a PositionRing window) into
+        coordinates in a single vectorized pass (requires numpy)
+
+        The coordinates are identical to those of forward_kinematics. Returns a dictionary of x and y arrays, and
+        of z (the height of the gripper above the bed in mm) if the counts include axis 3.
+        """
+        from PyNR.dependencies._kinematics import forward
+        profile = self.tool(tool)
+        return forward(counts, profile.derive(**kwargs), offset)
 
     def goto(self, *args, **kwargs):
         """
@@ -261,6 +545,9 @@ class Communicator(object):
         'z' for z-axis, 'g' for gripper, 's' for shoulder, and 'e' for elbow.
 
         Movesync will be used by default, but can be disabled by using 'movesync'=False.
+
+        Cartesian positions are converted with the kinematics of the 'tool' kwarg (see tool), e.g. tool=dispenser,
+        and the elbow configuration is chosen by the 'anglechoice' kwarg (see chooseangle).
         """
         if len(args) == 1:  # only one argument has been handed
             if type(args[0]) != dict:
@@ -275,74 +562,72 @@ class Communicator(object):
                 self.goto(i)
             return None
 
-        if 'x' in posdct:
-            if 'y' not in posdct:
-                raise ValueError('If x is provided, y must also be provided.')
-            options = self.inverse_kinematics(posdct, **kwargs)  # determine the angle options from inverse kinematics
-            posdct.update(self.chooseangle(options))  # choose the closest shoulder angle to current
+        future = None
+        for cmd, args in self.plan(posdct, **kwargs):  # move the robot
+            future = self.submit(cmd, *args, flush=False)
+        if self.kw['sendahead'] > 1:  # stream the moves, later commands will collect the acknowledgements
+            self.flush()
+        elif future is not None:  # threaded mode, wait for this caller's moves only
+            future.result()
+        else:
+            self.drain()
+        self.loc.update(posdct)  # update the axes locations
 
-            if 'z' in posdct:
-                pass
-                # TODO create a handler for z values (calibrate deck and offset according to x and y position)
-                # TODO need to know the exact height of the gripper bottom relative to the deck
-        # TODO create a handler for acceleration and velocity
-        deltas = {}  # dictionary for determining what axes are changing
-        for key in posdct:  # for each provided axis
-            if type(key) == int:  # ignore letter axis values
-                delta = self.loc[key] - posdct[
-                    key]  # determine the difference between the specified count and the current count
-                if delta != 0:  # if that is nonzero
-                    deltas[key] = self.loc[key] - posdct[key]  # append to deltas dictionary
+    def hold(self, wait=True):
+        """
+        holds the queued commands (threaded mode)
 
-        # determine axis movement order
-        order = []  # order list
-        if 'order' in kwargs:  # if an order was specified in the kwargs
-            orderdct = {  # letter keys for axes
-                'g': 0,
-                's': 1,
-                'e': 2,
-                'z': 3,
-            }
-            for i in kwargs['order']:  # append the axis indicies in the specified order
-                order.append(orderdct[i])
-        elif 0 in deltas:  # if a z movement is specified
-            if deltas[0] < 0:  # if moving up
-                for i in [0, 3, 1, 2]:
-                    if i in deltas:
-                        order.append(i)
-            else:  # if moving down
-                for i in [1, 2, 0, 3]:
-                    if i in deltas:
-                        order.append(i)
-        else:  # if no z movement
-            for i in [1, 2, 3]:
-                if i in deltas:
-                    order.append(i)
-        # print('order:\t',order)
-        # move the robot
-        if 'sync' in kwargs and kwargs['sync'] is False:  # if movesync is force disabled
-            for i in order:
-                self.execute('move', i, posdct[i])  # move the axis to the specified location
-        else:  # automatically apply movesync
-            while len(order) != 0:
-                if len(order) // 2:  # if there are at least two axes to move
-                    self.execute('movesync', order[0], order[1], posdct[order[0]],
-                                 posdct[order[1]])  # move the next two axes
-                    order = order[2:]  # remove the executed axes
-                else:  # if only one axis is left to move
-                    self.execute('move', order[0], posdct[order[0]])  # move that axis
-                    order = order[1:]
-        self.loc.update(posdct)  # update the axes locations
+        Only urgent commands are written until release is called. The hold is confirmed by an urgent echo,
+        which is acknowledged once the commands already in flight (at most sendahead) have finished.
+
+        Returns the time from the request to the confirmation in seconds (or a future for the confirmation if
+        wait is False).
+        """
+        if self.kw['threaded'] is False:
+            raise ValueError('Commands can only be held in threaded mode.')
+        self.held = True
+        return self.confirm(wait)
+
+    def home(self, axes=None):
+        """
+        homes the robot
 
-    def home(self):
-        """homes the robot"""
+        axes: only move these axes to zero counts. The firmware can only home every axis at once, so this does
+        not re-reference the axes (use it to return axes to their home positions without a full homing cycle).
+        """
+        if axes is not None:
+            self.goto({axis: 0 for axis in axes})
+            return None
         if self.kw['verbose']:
             print('Homing the robot')
-        self.sercon.write(self.pkg('HOME'))
+        self.t.sleep(self.waittime('home', ()))  # wait for spins to finish and outputs to settle
+        if self.kw['threaded'] is True:
+            future = self.enqueue(self.pkg('HOME'), timeout=100)  # a full homing cycle can take a while
+            self.loc.update({0: 0, 1: 0, 2: 0, 3: 0, })
+            return future.result()
+        self.drain()  # acknowledgements of earlier commands must not be mistaken for the home response
+        data = self.pkg('HOME')
+        issued = self.t.perf_counter()
+        if self.journal is not None:
+            self.journal.issued('HOME')
+        self.sercon.write(data)
         self.loc.update({0: 0, 1: 0, 2: 0, 3: 0, })
-        return self.read(100)
-
-    def inverse_kinematics(self, x, y=None, z=None, **kwargs):
+        try:
+            output = self.read(100, 'HOME')  # a full homing cycle can take a while
+        except NoResponse:
+            if self.journal is not None:
+                self.journal.failed()
+            raise
+        if self.journal is not None:
+            self.journal.acknowledged()
+        if self.metrics is not None:
+            self.metrics.written += len(data)
+            self.metrics.command(data, self.t.perf_counter() - issued)
+        if self.kw['shadow'] is True:
+            self.observe(data, output)
+        return output
+
+    def inverse_kinematics(self, x, y=None, z=None, tool=None, **kwargs):
         """
             converts the provided x y coordinates into joint angles
 
@@ -365,75 +650,98 @@ class Communicator(object):
             |    --      |        |       +-        |
             +----------------------------------------------> x-axis
 
+            tool: the tool whose kinematics are used (see tool; the bare arm if None)
+
+            Keyword arguments override the kinematic parameters of the tool (e.g. el_gr for a different arm length).
+            A tool handle avoids deriving the parameters on every call.
+
+            Solutions are memoized by target and kinematic profile (see the ikcache keyword).
             """
-        # allow for modification of function behaviour if keywords were supplied
-        if len(kwargs) > 0:  # if keyword arguments were supplied
-            execdict = dict(self.kw)
-            execdict.update(kwargs)
-        else:
-            execdict = self.kw
         if type(x) == dict:  # if provided with a position dictionary
             if 'x' not in x or 'y' not in x:
                 raise ValueError('Both x and y values must be passed to the inverse kinematics function.')
-            x_corr = x['x'] - execdict['x_offset']  # set and correct y
-            y_corr = x['y'] - execdict['y_offset']
-        else:
-            x_corr = x - execdict['x_offset']  # correct x
-            y_corr = y - execdict['y_offset']  # correct y
-
-        gamma = self.math.pi - self.math.acos(
-            # shoulder-elbow-gripper outside angle (elbow angle from straight out; radians; no sign)
-            (
-                x_corr ** 2 + y_corr ** 2 - execdict['sh_el'] ** 2 - execdict['el_gr'] ** 2
-            ) / (
-                -2 * execdict['sh_el'] * execdict['el_gr']
-            )
-        )
-
-        # print("outside elbow angle\t",math.degrees(gamma)) #from zero elbow angle, no sign.
-
-        pseudoline = self.math.sqrt(x_corr ** 2 + y_corr ** 2)  # length of pseudoline (hypotenuse)
-
-        pseudoangle = self.math.atan2(y_corr, x_corr)
-        # print("pseudoAngle\t\t\t",math.degrees(pseudoAngle))   #pseudoline angle
-
-        L1insideAngle = self.math.acos(  # shoulder-elbow-gripper angle
-            (
-                execdict['sh_el'] ** 2 + pseudoline ** 2 - (execdict['el_gr'] ** 2)
-            ) / (
-                2 * execdict['sh_el'] * pseudoline
-            )
-        )
-        # print("L1insideAngle\t\t",self.math.degrees(L1insideAngle))
-
-        L1angle1 = pseudoangle - self.math.pi / 2 - L1insideAngle  # CW angle
-        L1angle2 = pseudoangle - self.math.pi / 2 + L1insideAngle  # CCW angle
-        # print("L1angle1\t\t\t",self.math.degrees(L1angle1))
-        # print("L1angle2\t\t\t",self.math.degrees(L1angle2))
-
-        L1angle1 /= 2 * self.math.pi  # convert angle from radians to a fraction of a circle (1 rotation = 1.0)
-        L1angle2 /= 2 * self.math.pi
-        L1angle1 *= execdict['sh_cpr']  # convert fraction to counts
-        L1angle2 *= execdict['sh_cpr']
-        L1angle1 += execdict['sh_zero']  # adjust to zero
-        L1angle2 += execdict['sh_zero']
-
-        gamma /= 2 * self.math.pi
-        gamma *= execdict['el_cpr']
-
-        def intround(i): return int(round(i, 0))  # returns the integer value of x rounded
-
-        # print(L1angle1,L1angle2)
-
-        shright = {  # shoulder right, elbow left
-            2: intround(L1angle1),
-            1: intround(execdict['el_zero'] - gamma)
-        }
-        shleft = {  # shoulder left, elbow right
-            2: intround(L1angle2),
-            1: intround(execdict['el_zero'] + gamma)
-        }
-        return shright, shleft
+            x, y = x['x'], x['y']
+        profile = self.tool(tool)
+        if len(kwargs) != 0:  # allow for modification of function behaviour if keywords were supplied
+            profile = profile.derive(**kwargs)
+        shright, shleft = self.ikcache(x, y, profile)
+        return dict(shright), dict(shleft)  # the cached solutions must not be modified
+
+    def inverse_kinematics_array(self, x, y, tool=None, **kwargs):
+        """
+        converts arrays of x and y coordinates into joint counts in a single vectorized pass (requires numpy)
+
+        The counts are identical to those of inverse_kinematics. The tool and keyword arguments select the
+        kinematic parameters as for inverse_kinematics.
+
+        returns the shoulder right and shoulder left configurations as dictionaries of integer count arrays by
+        axis, and a boolean array of which targets are reachable (the counts of unreachable targets are 0)
+        """
+        from PyNR.dependencies._kinematics import inverse
+        profile = self.tool(tool)
+        return inverse(x, y, profile.derive(**kwargs))
+
+    def ioloop(self):
+        """
+        services the serial port from the I/O thread (threaded mode)
+
+        Queued commands are written while the sendahead window has room (everything queued at once is merged
+        into a single write), and acknowledgements are handed to the futures of the commands in flight in the
+        order they were written. A command which is not acknowledged before its deadline fails with NoResponse.
+
+        Commands are taken from the queue in order of priority. While held, only urgent commands are written.
+        """
+        self.sercon.timeout = 0.05  # longest time a new command waits while others are in flight
+        while True:
+            if self.preempt.is_set():  # a stop was requested
+                self.preempt.clear()
+                self.purge()
+            while len(self.inflight) < self.kw['sendahead']:  # fill the window with queued commands
+                try:
+                    entry = self.requests.get(block=len(self.inflight) == 0)  # sleep while there is nothing to do
+                except queue.Empty:
+                    break
+                priority, sequence, item = entry
+                if item is None:  # shut down
+                    self.flush()
+                    return None
+                if self.held is True and priority > URGENT:  # set aside until released
+                    self.parked.append(entry)
+                    if self.held is False:  # released in the meantime
+                        self.unpark()
+                    continue
+                data, validate, future, timeout = item
+                if future.done() is True or future.set_running_or_notify_cancel() is False:  # preempted or cancelled
+                    continue
+                self.wbuf += data
+                self.inflight.append((data, validate, future, self.t.monotonic() + timeout, self.t.perf_counter()))
+                if self.journal is not None:
+                    self.journal.issued(self.unpkg(data))
+            self.flush()
+            try:
+                chunk = self.sercon.read(max(1, self.sercon.in_waiting))  # returns early when woken
+                if self.metrics is not None:
+                    self.metrics.read += len(chunk)
+                self.decoder.feed(chunk)
+                frame = self.decoder.frame()
+                while frame is not None and len(self.inflight) != 0:
+                    self.complete(frame.decode('ascii'))
+                    frame = self.decoder.frame()
+            except Exception as e:  # the port failed, fail everything in flight
+                self.stale = True
+                while len(self.inflight) != 0:
+                    self.inflight.popleft()[2].set_exception(e)
+                    if self.journal is not None:
+                        self.journal.failed()
+                continue
+            if len(self.inflight) != 0 and self.t.monotonic() > self.inflight[0][3]:  # the robot went quiet
+                data, validate, future, deadline, issued = self.inflight.popleft()
+                if self.metrics is not None:
+                    self.metrics.timeouts += 1
+                if self.journal is not None:
+                    self.journal.failed()
+                self.stale = True
+                future.set_exception(NoResponse(self.unpkg(data), self.kw['verbose']))
 
     def keyboard(self):
         """
@@ -455,11 +763,17 @@ class Communicator(object):
         a  medium (100)
         z  small (10)
         x  micro (2)
+        
+        Not available in threaded mode (the key presses are not framed commands the I/O thread could write).
         """
+        if self.kw['threaded'] is True:
+            raise ValueError('Keyboard driving mode is not supported in threaded mode (the I/O thread owns the port).')
         if self.kw['verbose']:
             print('Initializing keyboard driving mode, input "/" to exit this mode')
         valid = ['i', 'y', 'k', 'h', ',', 'n', 'u', 'm', '/', 'q', 'a', 'z', 'x', 'help']
         inp = ''
+        self.drain()  # acknowledgements of earlier commands must not be mistaken for position reports
+        self.stale = True  # the robot is moved without the shadow state following
         self.sercon.write(self.pkg('KEYB'))
         while inp != '/':  # / is the exit command
             inp = ''
@@ -475,28 +789,96 @@ class Communicator(object):
                     self.parseloc(self.read(), True)  # read and parse the position output
                     # self.loc.update(self.position())
 
+    def loadstate(self):
+        """
+        reads the axis counts saved by savestate and marks the saved state as in use
+
+        Returns None if there is no saved state or it cannot be trusted: the last session was not disconnected
+        cleanly, the state is older than the stateage keyword, or every axis is at zero (indistinguishable from
+        a controller which was power cycled).
+        """
+        path = self.kw['statefile']
+        if path is None or os.path.isfile(path) is False:
+            return None
+        try:
+            with open(path, 'r') as statefile:
+                state = json.load(statefile)
+            loc = {int(axis): counts for axis, counts in state['loc'].items()}
+        except (ValueError, KeyError, AttributeError):  # unreadable state
+            return None
+        self.savestate(loc, clean=False)  # a crash from here on must not be trusted
+        if state.get('clean') is not True:
+            return None
+        if self.t.time() - state.get('time', 0) > self.kw['stateage']:
+            return None
+        if all(counts == 0 for counts in loc.values()):
+            return None
+        return loc
+
     def move_item(self, item, location):
         """moves the specified item from its current location to the specified location"""
         pass
         # TODO write a general pickup-place call sequence to make it a a single line
 
-    def output(self, axis, value, sleep=0.2):
-        """sets the output axis to the specified value"""
-        if type(axis) == int:  # if an axis value was provided
+    def observe(self, data, output):
+        """
+        updates the shadow state with an acknowledged command
+
+        A position report reconciles the shadow state: axes which differ by more than the drifttolerance keyword
+        are stored in the drift attribute (unless the state was stale) and the reported counts are adopted. Axes
+        which are still spinning (see spin) report intermediate counts, so they are neither checked nor adopted.
+        """
+        code = data[1:5]
+        if code == b'POSR':
+            reported = self.parseloc(output)
+            now = self.t.monotonic()
+            for axis, free in self.busy.items():
+                if free > now:  # the shadow state holds the counts the spin will end at
+                    reported.pop(axis, None)
+            if self.stale is False:
+                drift = {}
+                for axis, counts in list(self.shadow.items()):
+                    if axis in reported and abs(reported[axis] - counts) > self.kw['drifttolerance']:
+                        drift[axis] = (counts, reported[axis])
+                if len(drift) != 0:
+                    self.drift = drift
+            self.shadow.update(reported)
+        else:
+            track(self.shadow, self.outputs, self.unpkg(data))
+            if code != b'HOME':  # the counts after homing are known
+                return None
+        self.stale = False
+        self.reconciled = self.t.monotonic()
+
+    def output(self, axis, value, sleep=None, force=False):
+        """
+        sets the output axis to the specified value
+
+        Outputs which are already in the requested state are not written again (unless force is True).
+
+        The actuator is given time to settle (sleep, or its settle time in robot_parameters.settle) without blocking
+        the caller: only moves of the axes which depend on the output wait for it (see waittime).
+        """
+        if type(axis) == str:  # catches if a string axis was provided (mapped by robot_paramaters.py output dictionary)
+            axis = self.ops[axis]
+        if force is False and self.outputs.get(axis) == value:
+            return None
+        try:
             self.execute('output', axis, value)
-        elif type(
-                axis) == str:  # catches if a string axis was provided (mapped by robot_paramaters.py output dictionary)
-            self.execute('output', self.ops[axis], value)
-        self.t.sleep(sleep)  # sleep for 200 ms to allow the actuator to perform before moving
+        except Exception:  # the state of the output is unknown
+            self.outputs.pop(axis, None)
+            raise
+        self.outputs[axis] = value
+        settle = self.settle.get(axis, (0.2, None))[0] if sleep is None else sleep
+        self.settling[axis] = self.t.monotonic() + settle
 
     def parseloc(self, string, printout=False):
         """parses the location output string of the robot"""
-        splitstring = string.strip().split(',')[:-1]  # split it and remove /r values
+        if type(string) == str:
+            string = string.encode('ascii')
         dct = {}  # dictionary of positions with integer keys and values
-        for i in splitstring:  # go through list and add to dictionary
-            x, y = i.split(':')
-            y = int(y)
-            dct[int(x[-1])] = y
+        for match in POSITION.finditer(string):  # go through the axis:count pairs and add to dictionary
+            dct[int(match.group(1))] = int(match.group(2))
         if printout:  # print if specified
             for i in sorted(dct):
                 if dct[i] != 0:
@@ -524,10 +906,12 @@ class Communicator(object):
             z['z'] = item.location['z']
             z['z'] += item.p['height']  # offset by height
             z['z'] -= item.p['capheight']  # and cap height
-            self.goto({xy})
+            self.goto(xy)
             self.goto(z)
             self.output('gripper', 1)  # engage the gripper
             self.in_gripper = item  # put the item in the gripper variable
+            if self.journal is not None:
+                self.journal.gripper(item)
             self.goto({'z': self.kw['safeheight']})  # go to safe height
         else:
             # TODO code the pickup of a non-vial object
@@ -543,43 +927,251 @@ class Communicator(object):
             out = self.in_gripper
             self.in_gripper = None
             out.location.update(position)  # update the vial's position
+            if self.journal is not None:
+                self.journal.item(out)
+                self.journal.gripper(None)
             return out  # return the vial object
         else:
             out = position
             self.in_gripper = None
+            if self.journal is not None:
+                self.journal.gripper(None)
             return out  # return the position
 
-    def position(self):
+    def plan(self, posdct, **kwargs):
+        """
+        determines the commands needed to move to the provided position dictionary (see goto)
+
+        Cartesian positions are converted to axis counts, which are added to the dictionary. Targets outside the
+        joint limits raise UnreachableTarget (see checkreach).
+        Returns a list of (command, arguments) pairs.
+        """
+        configurations = self.checkreach(posdct, **kwargs)  # reject the target before anything is sent
+        if 'x' in posdct:
+            options = self.inverse_kinematics(posdct, **kwargs)  # determine the angle options from inverse kinematics
+            posdct.update(self.chooseangle([options[i] for i in configurations], kwargs.get('anglechoice')))  # see anglechoice
+
+            if 'z' in posdct:
+                pass
+                # TODO create a handler for z values (calibrate deck and offset according to x and y position)
+                # TODO need to know the exact height of the gripper bottom relative to the deck
+        # TODO create a handler for acceleration and velocity
+        deltas = {}  # dictionary for determining what axes are changing
+        for key in posdct:  # for each provided axis
+            if type(key) == int:  # ignore letter axis values
+                delta = self.loc[key] - posdct[
+                    key]  # determine the difference between the specified count and the current count
+                if delta != 0:  # if that is nonzero
+                    deltas[key] = self.loc[key] - posdct[key]  # append to deltas dictionary
+
+        # determine axis movement order
+        order = []  # order list
+        if 'order' in kwargs:  # if an order was specified in the kwargs
+            orderdct = {  # letter keys for axes
+                'g': 0,
+                's': 1,
+                'e': 2,
+                'z': 3,
+            }
+            for i in kwargs['order']:  # append the axis indicies in the specified order
+                if orderdct[i] in deltas:  # skip the axes which are not moving
+                    order.append(orderdct[i])
+        elif 0 in deltas:  # if a z movement is specified
+            if deltas[0] < 0:  # if moving up
+                for i in [0, 3, 1, 2]:
+                    if i in deltas:
+                        order.append(i)
+            else:  # if moving down
+                for i in [1, 2, 0, 3]:
+                    if i in deltas:
+                        order.append(i)
+        else:  # if no z movement
+            for i in [1, 2, 3]:
+                if i in deltas:
+                    order.append(i)
+        # print('order:\t',order)
+        moves = []  # the commands which will move the robot
+        if 'sync' in kwargs and kwargs['sync'] is False:  # if movesync is force disabled
+            for i in order:
+                moves.append(('move', (i, posdct[i])))  # move the axis to the specified location
+        else:  # automatically apply movesync
+            while len(order) != 0:
+                if len(order) // 2:  # if there are at least two axes to move
+                    moves.append(('movesync', (order[0], order[1], posdct[order[0]],
+                                               posdct[order[1]])))  # move the next two axes
+                    order = order[2:]  # remove the executed axes
+                else:  # if only one axis is left to move
+                    moves.append(('move', (order[0], posdct[order[0]])))  # move that axis
+                    order = order[1:]
+        return moves
+
+    def position(self, refresh=False):
         """get the position of of the robot
         This will be relative to the home position (or initial position if the robot was not homed)
+
+        In offline mode, the tracked location is returned.
+
+        In shadow mode (see the shadow keyword), the commands in flight are drained and the axis counts after the
+        acknowledged moves are returned without asking the robot, unless refresh is True, the reconcile period has passed or a command failed
+        since the last reconciliation (see reconcile).
         """
-        self.loc = self.parseloc(self.execute('position'))
+        if self.kw['shadow'] is True and self.kw['offline'] is False:
+            self.drain()  # the shadow state follows the acknowledgements
+            period = self.kw['reconcileperiod']
+            if refresh is False and self.stale is False and (
+                    period is None or self.t.monotonic() - self.reconciled < period):
+                return dict(self.shadow)
+            return self.reconcile()
+        output = self.execute('position')
+        if output is not None:  # offline mode does not return anything
+            self.loc = self.parseloc(output)
         return self.loc
 
-    def read(self, attempts=500, sleeptime=0.01):
+    def profiles(self):
         """
-        reads from the robot
-        
-        attempts: number of read attempts to make
-        
-        sleeptime: the time to wait between read attempts in seconds
-        """
-        # waiting = self.sercon.inWaiting() # check for waiting bytes
-        # while waiting == 0: # if there are no bytes, wait
-        #     self.t.sleep(sleeptime) # wait for a bit of time
-        #     waiting = self.sercon.inWaiting() # check again
-        # buffer = self.sercon.read(waiting).decode('ascii') # read from the buffer
-
-        # TODO create an error checking function (entire command should be encapsulated in < >)
-        buffer = ''
-        while buffer.endswith('>\r') is False:  # check for the end character
-            waiting = self.sercon.inWaiting()  # check for more bytes
-            while waiting == 0:  # wait for more bytes
-                self.t.sleep(sleeptime)
-                waiting = self.sercon.inWaiting()
-            buffer += self.sercon.read(waiting).decode('ascii')
-        # print(buffer)
-        return buffer
+        derives the kinematic profiles of the bare arm and of each tool from the kinematic parameters of kw
+
+        Called by tool whenever those parameters were changed (e.g. n9.kw['x_offset'] after a calibration), so the
+        kinematics, their cache and the reachability maps never use stale parameters.
+        """
+        from PyNR.dependencies.head_modules import KinematicProfile
+        self.profile = KinematicProfile(None, self.kw)
+        self.tools = {None: self.profile}
+        for name, overrides in self.toolparams.items():
+            self.tools[name] = self.profile.derive(name, **overrides)
+
+    def purge(self):
+        """fails every queued command which has not been written with Preempted, except urgent ones (I/O thread)"""
+        keep = []
+        dropped = list(self.parked)
+        self.parked.clear()
+        while True:
+            try:
+                entry = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if entry[2] is None or entry[0] <= URGENT:
+                keep.append(entry)
+            else:
+                dropped.append(entry)
+        for entry in keep:
+            self.requests.put(entry)
+        for priority, sequence, (data, validate, future, timeout) in dropped:
+            if future.done() is False:
+                future.set_exception(Preempted(self.unpkg(data)))
+
+    def read(self, timeout=None, command=None):
+        """
+        reads a complete response frame (terminated by '>\\r') from the robot
+
+        timeout: the maximum time to wait for the full frame in seconds (defaults to the acktimeout keyword)
+
+        command: the command the response belongs to (only used for the NoResponse error message)
+        """
+        if timeout is None:
+            timeout = self.kw['acktimeout']
+        deadline = self.t.monotonic() + timeout  # the read must complete before this time
+        frame = self.decoder.frame()  # a frame may already be waiting from an earlier chunk
+        shortened = False  # whether the port timeout was lowered to meet the deadline
+        while frame is None:
+            remaining = deadline - self.t.monotonic()
+            if remaining <= 0:  # the robot did not complete the frame in time
+                self.stale = True
+                if self.metrics is not None:
+                    self.metrics.timeouts += 1
+                if shortened is True:
+                    self.sercon.timeout = self.kw['timeout']
+                raise NoResponse(command, self.kw['verbose'])
+            if not self.sercon.timeout or remaining < self.sercon.timeout:
+                # reconfiguring the port is costly, so the timeout is only lowered close to the deadline
+                self.sercon.timeout = remaining
+                shortened = True
+            chunk = self.sercon.read(max(1, self.sercon.in_waiting))  # wake on the first byte, then take the rest
+            if self.metrics is not None:
+                self.metrics.read += len(chunk)
+            self.decoder.feed(chunk)
+            frame = self.decoder.frame()
+        if shortened is True:  # restore the timeout the port was opened with
+            self.sercon.timeout = self.kw['timeout']
+        return frame.decode('ascii')
+
+    def reachability(self, tool=None):
+        """
+        returns the ReachabilityMap of a tool (see _reachability.py and tool)
+
+        The map is built on first use (or loaded from the reachcache directory) and kept for the session.
+        """
+        profile = self.tool(tool)
+        if profile not in self.reachmaps:
+            from PyNR.dependencies._reachability import ReachabilityMap
+            self.reachmaps[profile] = ReachabilityMap(profile, self.kw['ranges'], cache=self.kw['reachcache'])
+        return self.reachmaps[profile]
+
+    def reconcile(self):
+        """
+        reads the axis counts from the robot (POSR) and checks them against the shadow state
+
+        The reported counts replace the shadow state. Raises DriftError if an axis differed from the shadow state
+        by more than the drifttolerance keyword (not checked if the shadow state was stale after an error).
+        """
+        self.drift = None
+        self.execute('position')  # the response is reconciled as it is acknowledged (see observe)
+        self.loc.update(self.shadow)
+        if self.drift is not None:
+            drift = self.drift
+            self.drift = None
+            raise DriftError(drift)
+        return dict(self.shadow)
+
+    def release(self):
+        """writes the commands held by hold"""
+        self.held = False
+        self.unpark()
+        self.wake()
+
+    def resources(self, cmd, args):
+        """the axes moved by a command"""
+        if cmd == 'move' or cmd == 'spin':
+            return args[:1]
+        if cmd == 'movesync':
+            return args[:2]
+        if cmd in ['home', 'keyboard', 'servo_on', 'zero']:
+            return range(4)
+        return ()
+
+    def resume(self, tray=None, reissue=True):
+        """
+        restores the state recorded in the journal after a crash and returns the recovered JournalState
+
+        The axis locations are rebuilt from the acknowledged moves, and the vials of the provided VialTray are
+        moved to their recorded locations (the held vial is stored in in_gripper). Completed protocol steps are
+        available in the steps of the returned state (and of the journal).
+
+        reissue: whether to issue the commands whose outcome is unknown again. Moves and outputs are absolute,
+        so this completes whatever was interrupted.
+
+        Create the communicator with homeinitialize=False, homing would discard the recovered locations.
+        """
+        if self.journal is None:
+            raise ValueError('A journal path must be provided (journal keyword) to resume a run.')
+        state = recover(self.kw['journal'])
+        self.loc.update(state.loc)
+        self.stale = True  # reconcile the shadow state with the robot before trusting it
+        vials = state.apply(tray) if tray is not None else {}
+        self.in_gripper = vials.get(state.gripper, state.gripper)
+        if reissue is True and self.kw['offline'] is False:
+            for n, command in zip(state.sequences, state.pending):
+                if self.kw['verbose']:
+                    print("Reissuing command '%s'" % command)
+                self.send(self.pkg(command))
+                self.journal.resolved(n)  # the reissued command is journaled under a new sequence number
+            self.drain()
+            for command in state.pending:
+                track(self.loc, state.outputs, command)
+            state.pending = []
+            state.sequences = []
+        self.outputs.update(state.outputs)
+        return state
 
     def roughhome(self):
         """roughly homes the robot for faster initialization"""
@@ -600,15 +1192,123 @@ class Communicator(object):
                          vel)
             self.loc.update({1: 100, 2: 100})
 
-    def spin(self, time=60, v=25000):
+    def savestate(self, loc=None, clean=True):
+        """
+        saves the axis counts (defaults to the tracked location) for a warm start (see warmstart)
+
+        clean: whether the state may be trusted by the next start (False while a session is running)
+        """
+        if loc is None:
+            loc = self.loc
+        state = {
+            'clean': clean,
+            'time': self.t.time(),
+            'loc': {str(axis): counts for axis, counts in loc.items() if type(axis) == int},
+        }
+        temporary = self.kw['statefile'] + '.tmp'
+        with open(temporary, 'w') as statefile:  # write then replace so a crash never leaves a partial file
+            json.dump(state, statefile)
+        os.replace(temporary, self.kw['statefile'])
+
+    def send(self, data, validate=False, flush=True, priority=NORMAL):
+        """writes packaged command bytes without waiting for the acknowledgement (see submit)"""
+        if self.kw['threaded'] is True:
+            if self.kw['verbose']:
+                print("Queueing command '%s'" % self.unpkg(data))
+            return self.enqueue(data, validate, priority=priority)
+        while len(self.inflight) >= self.kw['sendahead']:  # the window is full
+            self.flush()
+            self.acknowledge()
+        if self.kw['verbose']:
+            print("Executing command '%s'" % self.unpkg(data))
+        self.wbuf += data
+        self.inflight.append((data, validate, None, None, self.t.perf_counter()))
+        if self.journal is not None:
+            self.journal.issued(self.unpkg(data))
+        self.unsent += 1
+        if flush is True:
+            self.flush()
+
+    def solve(self, x, y, profile):
+        """
+        solves the inverse kinematics of a target without the cache (see inverse_kinematics)
+
+        profile: the KinematicProfile of the tool
+        """
+        return profile.inverse(x, y)
+
+    def spin(self, time=60, v=25000, wait=False):
         """spins the gripper for the specified amount of time
 
         a velocity of 2000 is 60 rpm
         25000 is 750 RPM
+
+        The spin runs in the background: moves of the other axes and outputs go ahead while the gripper spins,
+        and the next move of the gripper rotation waits for the spin to finish (see waitfor).
+
+        wait: whether to wait for the spin to finish before returning
         """
         endcounts = self.loc[0] + int(time * v)
         self.execute('spin', 0, endcounts, a=50000, v=v)
+        self.busy[0] = self.t.monotonic() + movetime(endcounts - self.loc[0], v, 50000)
         self.loc.update({0: endcounts})
+        if wait is True:
+            self.waitfor(0)
+
+    def stop(self, wait=True):
+        """
+        stops the robot as soon as possible
+
+        Every command which has not been written to the robot is dropped (in threaded mode their futures fail
+        with Preempted, commands held by hold included) and an urgent echo is written ahead of anything queued
+        afterwards. The robot has stopped once the echo is acknowledged, i.e. once the commands already in
+        flight (at most sendahead) have finished.
+
+        In threaded mode this may be called from any thread. Otherwise it must be called from the thread which
+        submits the commands.
+
+        Returns the time from the request to the confirmation in seconds (or a future for the confirmation if
+        wait is False in threaded mode).
+        """
+        if self.kw['threaded'] is True:
+            self.preempt.set()
+            return self.confirm(wait)
+        start = self.t.perf_counter()
+        self.discard()  # drop the buffered commands
+        self.drain()  # and wait for the ones in flight
+        latency = self.t.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.preemption.record(int(latency * 1e6))
+        return latency
+
+    def submit(self, cmd, *args, validate=False, flush=True, priority=NORMAL, **kwargs):
+        """
+        submits a command without waiting for its acknowledgement
+
+        Up to the sendahead keyword number of commands may be in flight at once, after which the oldest
+        acknowledgement is read before the command is sent. Acknowledgements are matched to commands in the
+        order they were submitted.
+
+        flush: whether to write the command immediately. If False, the command is buffered and written with
+        the next flush (or once the window is full), which merges consecutive commands into a single write.
+
+        In threaded mode the command is queued for the I/O thread and a concurrent.futures.Future for its
+        acknowledgement is returned (the flush argument is ignored). Queued commands are written in order of
+        priority (see URGENT, NORMAL and BACKGROUND), and in the order they were submitted within a priority.
+        """
+        data = self.encode(cmd, *args, **kwargs)
+        wait = self.waittime(cmd, args)
+        if wait > 0.:  # an axis is still spinning or depends on an output which is still settling
+            if self.kw['threaded'] is False:
+                self.flush()  # do not hold back the commands buffered before it
+            self.t.sleep(wait)
+        if self.kw['offline'] is True:  # if offline mode is enabled, don't actually execute anything
+            return None
+        future = self.send(data, validate, flush, priority)
+        if future is not None:  # threaded mode, track completion per axis
+            for axis in self.resources(cmd, args):
+                self.using[axis] = future
+        return future
 
     def test(self, repeats=1):
         """
@@ -623,6 +1323,24 @@ class Communicator(object):
             print(repr(self.execute('random')))  # grabs a random number
             print(repr(self.execute('plustwo', i + 1)))  # returns the iteration plus 2
 
+    def tool(self, tool=None):
+        """
+        returns the KinematicProfile of a tool
+
+        tool: a KinematicProfile, a head module (see head_modules.Head), the name of a tool (see
+        robot_parameters.tools and the tools keyword) or None for the bare arm
+
+        Heads, names and None follow changes to the kinematic parameters of kw (see profiles). A KinematicProfile
+        is a snapshot of the parameters it was derived from.
+        """
+        if isinstance(tool, str) or tool is None:
+            if self.calibration(self.kw) != self.profile.key:  # the kinematic parameters were changed
+                self.profiles()
+            if tool not in self.tools:
+                raise KeyError('Unknown tool: %s' % tool)
+            return self.tools[tool]
+        return getattr(tool, 'profile', tool)
+
     def uncap(self, vial, tray):
         """
         uncaps the provided Vial object
@@ -637,6 +1355,96 @@ class Communicator(object):
             # TODO make this a specific unscrew function
             # TODO when an uncap is performed, set the in_gripper to 'cap' (and unset in recap)
 
+    def unpark(self):
+        """returns the commands set aside while held to the queue"""
+        while True:
+            try:
+                self.requests.put(self.parked.popleft())
+            except IndexError:
+                return None
+
+    def unpkg(self, data):
+        """recovers the command string from a packaged command (the inverse of pkg)"""
+        return data[1:-1].decode('ascii')
+
+    def waitfor(self, *resources):
+        """
+        waits until the provided axes and outputs are free, regardless of the other commands in flight
+
+        resources: axis numbers, which are free once their last submitted command was acknowledged and their spin
+        has finished, and output names (see robot_parameters.outputs), which are free once they have settled
+
+        e.g. n9.spin(10); n9.goto(station); n9.waitfor(0, 'gripper')
+        """
+        for resource in resources:
+            if type(resource) == str:  # an output
+                settled = self.settling.get(self.ops[resource])
+                if settled is not None:
+                    self.t.sleep(max(settled - self.t.monotonic(), 0.))
+                continue
+            if self.kw['threaded'] is True:
+                future = self.using.get(resource)
+                if future is not None:
+                    try:
+                        future.result()
+                    except Preempted:
+                        pass
+            elif len(self.inflight) != 0:  # acknowledgements are read in order
+                self.drain()
+            free = self.busy.get(resource)
+            if free is not None:
+                self.t.sleep(max(free - self.t.monotonic(), 0.))
+
+    def waittime(self, cmd, args):
+        """
+        the time (s) until the axes moved by a command are free: until a spin of the axes has finished and the
+        outputs which they depend on have settled (see output)
+        """
+        if len(self.settling) == 0 and len(self.busy) == 0:
+            return 0.
+        axes = self.resources(cmd, args)
+        if len(axes) == 0:
+            return 0.
+        now = self.t.monotonic()
+        wait = 0.
+        for axis in axes:
+            free = self.busy.get(axis)
+            if free is not None:
+                if free <= now:  # forget spins which have finished
+                    self.busy.pop(axis, None)
+                else:
+                    wait = max(wait, free - now)
+        for key, settled in list(self.settling.items()):
+            if settled <= now:  # forget outputs which have settled
+                self.settling.pop(key, None)
+            elif key not in self.settle or self.settle[key][1].isdisjoint(axes) is False:
+                wait = max(wait, settled - now)
+        return wait
+
+    def wake(self):
+        """interrupts a blocking read of the I/O thread so newly queued commands are written immediately"""
+        if self.iothread is not None and hasattr(self.sercon, 'cancel_read'):
+            self.sercon.cancel_read()
+
+    def warmstart(self):
+        """
+        restores the axis counts saved on the last clean disconnect if the robot reports the same counts
+
+        Returns True if the saved state was trusted (the robot does not need homing) and False otherwise.
+        """
+        stored = self.loadstate()
+        if stored is None:
+            return False
+        reported = self.position(refresh=True)
+        for axis in stored:
+            if abs(reported.get(axis, 0) - stored[axis]) > self.kw['statetolerance']:
+                if self.kw['verbose']:
+                    print('Axis %d reports %d counts but %d were saved, homing' % (axis, reported.get(axis, 0), stored[axis]))
+                return False
+        if self.kw['verbose']:
+            print('Warm start, the saved axis counts match the robot')
+        return True
+
 
 if __name__ == '__main__':
     from PyNR.dependencies._communicator import communicator
@@ -0,0 +1,237 @@
+"""
+An emulator of the NR9 firmware served on a pseudo-terminal
+
+The emulator speaks the protocol of the commands in _commands.py so that the full communicator can be run and
+load tested without a robot. Moves are acknowledged once they would have finished on the robot, using a
+trapezoidal velocity/acceleration profile for every axis (see general.movetime), and targets are limited to
+the axis ranges in robot_parameters.py. Spins (MOID) are acknowledged immediately and run in the background
+on their axis.
+
+Run it as a separate process (Linux/macOS) and connect a communicator to the printed port:
+
+    python -m PyNR.dependencies._emulator --timescale 0.1
+
+or start it in-process:
+
+    emulator = Emulator(timescale=0.1)
+    emulator.start()
+    n9 = Communicator(port=emulator.port)
+"""
+import os
+import re
+import threading
+import time
+
+from PyNR.dependencies.general import movetime
+
+COMMAND = re.compile(rb'<(\w{4})(.*)')  # four letter command followed by its arguments
+ARGUMENT = re.compile(rb'V\d+\[(-?\d+)\]')
+
+
+class Emulator(object):
+    def __init__(self, **kwargs):
+        """
+        Emulates the NR9 firmware on the master side of a pseudo-terminal. The port to connect to is
+        stored in the port attribute.
+
+        **\\*\\*kwargs**
+
+        timescale: 1.
+            Multiplier applied to every motion time (e.g. 0.1 runs ten times faster than the robot).
+
+        hometime: 5.
+            The duration of a full homing cycle in seconds.
+
+        latency: 0.001
+            Firmware processing time for every command in seconds.
+
+        ranges: robot_parameters.params['ranges']
+            Axis count ranges, targets outside of these are limited to the range (and recorded in faults).
+        """
+        from PyNR.dependencies.robot_parameters import params
+        self.kw = {
+            'timescale': 1.,  # multiplier applied to motion times
+            'hometime': 5.,  # duration of a full homing cycle (s)
+            'latency': 0.001,  # processing time for every command (s)
+            'ranges': params['ranges'],  # axis count ranges
+            'naxes': 8,  # number of axes reported by POSR
+        }
+        if set(kwargs.keys()) - set(self.kw.keys()):  # check for invalid keyword arguments
+            string = ''
+            for i in set(kwargs.keys()) - set(self.kw.keys()):
+                string += ' %s' % i
+            raise KeyError('Unsupported keyword argument(s): %s' % string)
+        self.kw.update(kwargs)
+
+        self.pos = [0] * self.kw['naxes']  # axis counts
+        self.spins = {}  # background spins by axis: (start time, end time, start counts, end counts)
+        self.outputs = {}  # output states
+        self.keyboard = False  # whether keyboard driving mode is active
+        self.step = 100  # keyboard driving step size
+        self.faults = []  # commands whose targets were limited to the axis ranges
+        self.received = 0  # number of commands processed
+        self.motiontime = 0.  # total time spent on (scaled) moves and homing in seconds
+
+        self.master, self.slave = os.openpty()
+        import tty
+        tty.setraw(self.slave)  # no echo or line editing on the robot side
+        self.port = os.ttyname(self.slave)
+        self.thread = None
+        self.running = False
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.port)
+
+    def clamp(self, axis, target, command):
+        """limits the target counts to the range of the axis"""
+        if axis in self.kw['ranges']:
+            low, high = self.kw['ranges'][axis]
+            if target < low or target > high:
+                self.faults.append(command)
+                return min(max(target, low), high)
+        return target
+
+    def handle(self, command):
+        """processes a single command (without '<' and '\\r') and returns the response"""
+        match = COMMAND.match(b'<' + command)
+        if match is None:
+            return None
+        cmd = match.group(1)
+        args = [int(i) for i in ARGUMENT.findall(match.group(2))]
+        self.received += 1
+        self.sleep(self.kw['latency'])
+        if cmd == b'POSR':  # report the positions
+            return b'<' + b''.join(b'Pos%d:%d,' % (i, v) for i, v in enumerate(self.position())) + b'>\r'
+        elif cmd == b'MOAX':  # move a single axis
+            axis, target, acc, vel = args
+            self.move({axis: self.clamp(axis, target, command)}, acc, vel)
+        elif cmd == b'MOSY':  # synchronous move of two axes
+            axis1, axis2, target1, target2, acc, vel = args
+            self.move({axis1: self.clamp(axis1, target1, command), axis2: self.clamp(axis2, target2, command)},
+                      acc, vel)
+        elif cmd == b'MOID':  # spin in the background, acknowledged immediately
+            axis, target, acc, vel = args
+            self.wait(axis)
+            start = time.monotonic()
+            self.spins[axis] = (start, start + movetime(target - self.pos[axis], vel, acc) * self.kw['timescale'],
+                                self.pos[axis], target)
+        elif cmd == b'HOME':
+            for axis in list(self.spins):
+                self.wait(axis)
+            self.sleep(self.kw['hometime'] * self.kw['timescale'])
+            self.motiontime += self.kw['hometime'] * self.kw['timescale']
+            self.pos = [0] * self.kw['naxes']
+        elif cmd == b'OUTP':
+            self.outputs[args[0]] = args[1]
+        elif cmd == b'ZERO' or cmd == b'SEON':  # set the current positions as zero
+            for axis in list(self.spins):
+                self.wait(axis)
+            self.pos = [0] * self.kw['naxes']
+        elif cmd == b'KEYB':
+            self.keyboard = True
+        return b'<' + command + b'>\r'  # acknowledge by echoing the command
+
+    def key(self, char):
+        """processes a keyboard driving mode key and returns the position response"""
+        moves = {b'i': (0, 1), b'y': (0, -1), b'k': (1, 1), b'h': (1, -1),
+                 b',': (2, 1), b'n': (2, -1), b'u': (3, -1), b'm': (3, 1)}
+        steps = {b'q': 1000, b'a': 100, b'z': 10, b'x': 2}
+        if char == b'/':  # exit keyboard driving mode
+            self.keyboard = False
+            return None
+        if char in steps:
+            self.step = steps[char]
+        elif char in moves:
+            axis, sign = moves[char]
+            self.pos[axis] = self.clamp(axis, self.pos[axis] + sign * self.step, char)
+        return b'<' + b''.join(b'Pos%d:%d,' % (i, v) for i, v in enumerate(self.pos)) + b'>\r'
+
+    def move(self, targets, acc, vel):
+        """moves the axes to their targets simultaneously and returns once the move would be complete"""
+        duration = 0.
+        for axis in targets:
+            self.wait(axis)
+            duration = max(duration, movetime(targets[axis] - self.pos[axis], vel, acc))
+        self.sleep(duration * self.kw['timescale'])
+        self.motiontime += duration * self.kw['timescale']
+        for axis in targets:
+            self.pos[axis] = targets[axis]
+
+    def position(self):
+        """the current axis counts (including the progress of background spins)"""
+        now = time.monotonic()
+        out = list(self.pos)
+        for axis, (start, end, startcounts, endcounts) in list(self.spins.items()):
+            if now >= end:
+                out[axis] = endcounts
+            else:
+                out[axis] = int(startcounts + (endcounts - startcounts) * (now - start) / (end - start))
+        return out
+
+    def run(self):
+        """reads commands from the pseudo-terminal and answers them until stopped"""
+        buffer = bytearray()
+        while self.running:
+            try:
+                buffer += os.read(self.master, 1024)
+            except OSError:  # the pseudo-terminal was closed
+                return None
+            while len(buffer) != 0:
+                if self.keyboard is True and buffer[:1] != b'<':  # single key presses
+                    response = self.key(bytes(buffer[:1]))
+                    del buffer[:1]
+                else:
+                    start = buffer.find(b'<')
+                    if start == -1:  # noise
+                        del buffer[:]
+                        break
+                    end = buffer.find(b'\r', start)
+                    if end == -1:  # incomplete command
+                        del buffer[:start]
+                        break
+                    command = bytes(buffer[start + 1:end])
+                    del buffer[:end + 1]
+                    response = self.handle(command)
+                if response is not None:
+                    os.write(self.master, response)
+
+    def sleep(self, duration):
+        """waits for the provided duration"""
+        if duration > 0.:
+            time.sleep(duration)
+
+    def start(self):
+        """starts serving the pseudo-terminal from a background thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='NR9 emulator', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """stops the emulator and closes the pseudo-terminal"""
+        self.running = False
+        os.close(self.master)
+        os.close(self.slave)
+
+    def wait(self, axis):
+        """waits for a background spin on the axis to finish"""
+        if axis in self.spins:
+            start, end, startcounts, endcounts = self.spins.pop(axis)
+            self.sleep(end - time.monotonic())
+            self.pos[axis] = endcounts
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serves an emulated NR9 robot on a pseudo-terminal')
+    parser.add_argument('--timescale', type=float, default=1., help='multiplier applied to motion times')
+    parser.add_argument('--hometime', type=float, default=5., help='duration of a full homing cycle (s)')
+    options = parser.parse_args()
+
+    emulator = Emulator(timescale=options.timescale, hometime=options.hometime)
+    print('Emulated NR9 listening on %s' % emulator.port)
+    emulator.running = True
+    try:
+        emulator.run()
+    except KeyboardInterrupt:
+        emulator.stop()
@@ -0,0 +1,91 @@
+"""
+Incremental decoding of the responses sent by the NR9
+
+Every response from the robot is packaged as '<...>\r'. Bytes are fed into a FrameDecoder as they arrive
+from the port and complete frames are pulled out one at a time, so several frames arriving in one chunk
+(pipelined commands) or a frame split over several chunks are both handled without rebuilding strings.
+
+Position (POSR) responses have the form '<Pos0:123,Pos1:456,...,>\r' and can be parsed straight into an
+integer array indexed by axis number.
+"""
+import re
+from array import array
+
+START = b'<'  # frame start character
+END = b'>\r'  # frame end sequence
+NAXES = 8  # number of axes reported by a POSR response
+
+POSITION = re.compile(rb'(\d):(-?\d+),')  # axis number and count pairs of a POSR payload
+
+
+class FrameDecoder(object):
+    def __init__(self, maxframe=512):
+        """
+        pulls complete '<...>\\r' frames out of a reusable byte buffer
+
+        Bytes outside of a frame (line noise, the tail of a frame left over from a timed out read) are
+        discarded. If a new '<' is seen before the current frame has ended, the decoder resynchronises on
+        the new start character.
+
+        maxframe: the longest frame that will be accepted before the partial frame is discarded
+        """
+        self.buffer = bytearray()  # received bytes that have not been returned as a frame yet
+        self.maxframe = maxframe
+        self.discarded = 0  # number of bytes dropped while resynchronising
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def clear(self):
+        """discards everything in the buffer"""
+        self.discarded += len(self.buffer)
+        del self.buffer[:]
+
+    def feed(self, data):
+        """appends received bytes to the buffer"""
+        self.buffer += data
+
+    def frame(self):
+        """returns the next complete frame (including '<' and '>\\r') as bytes, or None if there isn't one"""
+        buf = self.buffer
+        while True:
+            start = buf.find(START)
+            if start == -1:  # no frame has started, everything in the buffer is noise
+                self.clear()
+                return None
+            if start > 0:  # drop the noise before the start character
+                self.discarded += start
+                del buf[:start]
+            end = buf.find(END, 1)
+            if end == -1:  # the frame is incomplete
+                if len(buf) > self.maxframe:  # a runaway frame, resynchronise on the next start character
+                    restart = buf.find(START, 1)
+                    self.discarded += len(buf) if restart == -1 else restart
+                    del buf[:len(buf) if restart == -1 else restart]
+                    continue
+                return None
+            restart = buf.rfind(START, 1, end)
+            if restart != -1:  # a new frame started before this one ended
+                self.discarded += restart
+                del buf[:restart]
+                continue
+            out = bytes(buf[:end + 2])
+            del buf[:end + 2]  # deleting from the front of a bytearray does not copy the remainder
+            return out
+
+
+def parse_position(frame, out=None):
+    """
+    parses the payload of a POSR frame into an integer array indexed by axis number
+
+    frame: the frame as bytes (a str is also accepted)
+
+    out: an existing array to fill (e.g. to avoid allocating an array for every poll)
+    """
+    if out is None:
+        out = array('q', bytes(8 * NAXES))
+    if type(frame) == str:
+        frame = frame.encode('ascii')
+    for match in POSITION.finditer(frame):
+        out[int(match.group(1))] = int(match.group(2))
+    return out
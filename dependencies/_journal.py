@@ -0,0 +1,221 @@
+"""
+An append-only journal of the commands issued to the robot, their acknowledgements and item state changes
+
+The journal is written as one JSON record per line. Records are buffered in memory and committed in groups by
+a background thread (one write and one fsync per commit interval), so journaling does not stall the command
+stream. At most the last commit interval of records is lost if the host crashes.
+
+After a crash, recover() rebuilds the axis locations from the acknowledged moves, the item (vial) locations,
+the item in the gripper, the completed protocol steps and the commands whose outcome is unknown. Moves are
+absolute, so the unknown commands can simply be issued again (see Communicator.resume). A reissued command is
+journaled under a new sequence number and its original is marked resolved, so it is never reissued twice.
+
+    n9 = Communicator(journal='run.journal')
+    for vial in tray:
+        if vial.name in n9.journal.steps:  # completed before a crash
+            continue
+        ...
+        n9.journal.item(vial)
+        n9.journal.step(vial.name)
+
+    # after a crash
+    n9 = Communicator(journal='run.journal', homeinitialize=False)
+    state = n9.resume(tray)
+"""
+from collections import deque
+import json
+import os
+import re
+import threading
+import time
+
+ARGUMENT = re.compile(r'V\d+\[(-?\d+)\]')
+
+
+def track(loc, outputs, command):
+    """updates the axis locations and output states with an acknowledged command string (e.g. 'MOAX V1[3] V2[9000]')"""
+    code = command[:4]
+    args = [int(i) for i in ARGUMENT.findall(command)]
+    if code == 'MOAX' or code == 'MOID':  # single axis move or spin
+        loc[args[0]] = args[1]
+    elif code == 'MOSY':  # synchronous two axis move
+        loc[args[0]] = args[2]
+        loc[args[1]] = args[3]
+    elif code == 'HOME' or code == 'ZERO' or code == 'SEON':
+        for axis in range(4):
+            loc[axis] = 0
+    elif code == 'OUTP':
+        outputs[args[0]] = args[1]
+
+
+class JournalState(object):
+    def __init__(self):
+        """the state rebuilt from a journal (see recover)"""
+        self.loc = {}  # axis counts after the last acknowledged moves
+        self.outputs = {}  # output states after the last acknowledged output commands
+        self.items = {}  # the last recorded state of each item by name ({'location': {...}, 'capped': bool})
+        self.gripper = None  # name of the item held in the gripper
+        self.steps = []  # completed protocol steps in the order they were completed
+        self.pending = []  # commands which were issued but whose outcome is unknown (in the order they were issued)
+        self.sequences = []  # the sequence numbers of the pending commands
+        self.sequence = 0  # the next command sequence number
+
+    def __repr__(self):
+        return "%s(%d steps, %d pending)" % (self.__class__.__name__, len(self.steps), len(self.pending))
+
+    def apply(self, tray):
+        """updates the locations and capped states of the vials in a VialTray, returns the vials by name"""
+        vials = {vial.name: vial for vial in tray}
+        for name, state in self.items.items():
+            if name in vials:
+                if state.get('location') is not None:
+                    vials[name].location.update(state['location'])
+                if 'capped' in state:
+                    vials[name].capped = state['capped']
+        return vials
+
+
+def recover(path):
+    """reads a journal and returns the JournalState at the time of the last committed record"""
+    state = JournalState()
+    issued = {}  # commands whose outcome is not known yet by sequence number
+    if os.path.isfile(path) is False:
+        return state
+    with open(path, 'r', encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except ValueError:  # a record torn by the crash
+                continue
+            event = record['e']
+            if event == 'issue':
+                issued[record['n']] = record['c']
+                state.sequence = record['n'] + 1
+            elif event == 'ack':
+                command = issued.pop(record['n'], None)
+                if command is not None:
+                    track(state.loc, state.outputs, command)
+                    if command.startswith('HOME'):  # homing supersedes any earlier command
+                        issued = {n: c for n, c in issued.items() if n > record['n']}
+            elif event == 'drop' or event == 'resolve':  # never written to the robot, or reissued by a resume
+                issued.pop(record['n'], None)
+            elif event == 'gripper':
+                state.gripper = record['item']
+            elif event == 'item':
+                state.items.setdefault(record['name'], {}).update(record['state'])
+            elif event == 'step':
+                state.steps.append(record['label'])
+    state.sequences = sorted(issued)
+    state.pending = [issued[n] for n in state.sequences]
+    return state
+
+
+class Journal(object):
+    def __init__(self, path, interval=0.05):
+        """
+        an append-only journal with group-committed fsync
+
+        path: the journal file (appended to if it exists, so a resumed run continues the same journal)
+
+        interval: the longest time between commits in seconds
+        """
+        self.path = path
+        self.interval = interval
+        state = recover(path)
+        self.sequence = state.sequence  # the next command sequence number
+        self.steps = set(state.steps)  # completed protocol steps
+        self.outstanding = deque()  # sequence numbers of the issued commands awaiting acknowledgement (oldest first)
+        self.buffer = []  # records which have not been committed
+        self.lock = threading.Lock()  # guards the buffer
+        self.commitlock = threading.Lock()  # serializes commits
+        self.wakeup = threading.Event()
+        self.file = open(path, 'a', encoding='utf-8')
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='NR9 journal', daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.path)
+
+    def acknowledged(self):
+        """records the acknowledgement of the oldest outstanding command"""
+        self.append({'e': 'ack', 'n': self.outstanding.popleft()})
+
+    def append(self, record):
+        """buffers a record for the next commit"""
+        record['t'] = time.time()
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.buffer.append(line)
+
+    def close(self):
+        """commits the remaining records and closes the journal"""
+        self.running = False
+        self.wakeup.set()
+        self.thread.join()
+        self.commit()
+        self.file.close()
+
+    def commit(self):
+        """writes the buffered records and forces them to disk"""
+        with self.commitlock:
+            with self.lock:
+                lines = self.buffer
+                self.buffer = []
+            if len(lines) == 0 or self.file.closed:
+                return None
+            self.file.write(''.join(lines))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def dropped(self):
+        """records that the newest outstanding command was never written to the robot"""
+        self.append({'e': 'drop', 'n': self.outstanding.pop()})
+
+    def failed(self):
+        """forgets the oldest outstanding command, whose outcome is unknown (it remains pending on recovery)"""
+        self.outstanding.popleft()
+
+    def gripper(self, item):
+        """records the item now held in the gripper (None when empty)"""
+        self.append({'e': 'gripper', 'item': None if item is None else getattr(item, 'name', str(item))})
+
+    def issued(self, command):
+        """records a command string (e.g. 'MOAX V1[3] V2[9000]') written to the robot"""
+        self.outstanding.append(self.sequence)
+        self.append({'e': 'issue', 'n': self.sequence, 'c': command})
+        self.sequence += 1
+
+    def item(self, item, **state):
+        """
+        records the state of an item
+
+        The location and capped state of a Vial are recorded by default, keyword arguments are recorded
+        in addition.
+        """
+        if getattr(item, 'location', None) is not None:
+            state.setdefault('location', {key: float(value) for key, value in item.location.items()})
+        if hasattr(item, 'capped'):
+            state.setdefault('capped', item.capped)
+        self.append({'e': 'item', 'name': item.name, 'state': state})
+
+    def resolved(self, n):
+        """records that a recovered command (by its sequence number) was issued again under a new sequence number"""
+        self.append({'e': 'resolve', 'n': n})
+
+    def run(self):
+        """commits the buffered records every interval (runs on the journal thread)"""
+        while self.running:
+            self.wakeup.wait(self.interval)
+            self.commit()
+
+    def step(self, label, sync=False):
+        """
+        marks a protocol step as complete
+
+        sync: whether to commit immediately (for steps which must not be repeated)
+        """
+        self.steps.add(label)
+        self.append({'e': 'step', 'label': label})
+        if sync is True:
+            self.commit()
@@ -0,0 +1,73 @@
+"""
+Vectorized kinematics of the NR9 arm over NumPy arrays
+
+The functions mirror the scalar methods of Communicator operation for operation, so that the counts agree
+exactly with the scalar path, and take the kinematic parameters as a KinematicProfile (see head_modules).
+
+    shright, shleft, reachable = n9.inverse_kinematics_array(xs, ys)
+    times, counts = ring.window()  # the samples of a PositionRing
+    coordinates = n9.forward_kinematics_array(counts)
+"""
+import numpy as np
+
+
+def inverse(x, y, p):
+    """
+    converts arrays of x and y coordinates into the counts of both elbow configurations (see
+    Communicator.inverse_kinematics)
+
+    p: the KinematicProfile of the tool (see head_modules)
+
+    returns the shoulder right and shoulder left configurations as dictionaries of int64 count arrays by axis
+    ({2: shoulder, 1: elbow}), and a boolean array of which targets are reachable. The counts of unreachable
+    targets are 0.
+    """
+    x_corr = np.asarray(x, dtype=float) - p.x_offset
+    y_corr = np.asarray(y, dtype=float) - p.y_offset
+    with np.errstate(invalid='ignore', divide='ignore'):  # unreachable targets are masked below
+        cosgamma = (x_corr ** 2 + y_corr ** 2 - p.sh_el2 - p.el_gr2) / p.gammadivisor
+        pseudoline = np.sqrt(x_corr ** 2 + y_corr ** 2)
+        cosinside = (p.sh_el2 + pseudoline ** 2 - p.el_gr2) / (p.insidedivisor * pseudoline)
+        reachable = (np.abs(cosgamma) <= 1.) & (np.abs(cosinside) <= 1.)
+        gamma = np.pi - np.arccos(cosgamma)
+        pseudoangle = np.arctan2(y_corr, x_corr) - np.pi / 2
+        inside = np.arccos(cosinside)
+
+    def counts(value):  # round half to even like round() and zero the unreachable targets
+        return np.where(reachable, np.rint(value), 0.).astype(np.int64)
+
+    gamma = gamma * p.el_cprad
+    shright = {
+        2: counts((pseudoangle - inside) * p.sh_cprad + p.sh_zero),
+        1: counts(p.el_zero - gamma),
+    }
+    shleft = {
+        2: counts((pseudoangle + inside) * p.sh_cprad + p.sh_zero),
+        1: counts(p.el_zero + gamma),
+    }
+    return shright, shleft, reachable
+
+
+def forward(counts, p, offset=False):
+    """
+    converts an (N, axes) array of axis counts (column i holds axis i) into coordinates (see
+    Communicator.forward_kinematics)
+
+    p: the KinematicProfile of the tool (see head_modules)
+
+    offset: whether to apply the x and y offsets, which makes the result the inverse of inverse()
+
+    returns a dictionary of x and y arrays, and of z (the height above the bed in mm) if the counts include axis 3
+    """
+    counts = np.asarray(counts)
+    sh = (counts[:, 2] - p.sh_zero) / p.sh_cprad  # shoulder angle
+    el = (p.el_zero - counts[:, 1]) / p.el_cprad  # elbow angle
+    x = p.sh_el * np.cos(sh) + p.el_gr * np.cos(sh + el)
+    y = p.sh_el * np.sin(sh) + p.el_gr * np.sin(sh + el)
+    out = {'x': -y, 'y': x}
+    if offset is True:
+        out['x'] += p.x_offset
+        out['y'] += p.y_offset
+    if counts.shape[1] > 3:
+        out['z'] = (p.zbedzero - counts[:, 3]) / p.zcountspermm
+    return out
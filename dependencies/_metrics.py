@@ -0,0 +1,226 @@
+"""
+Low-overhead instrumentation of the communication with the robot
+
+Round-trip latencies (from the command being issued to its acknowledgement) are recorded per command type in
+HDR-style histograms: values are counted in log-linear buckets, so recording is a few integer operations and
+the memory use is fixed regardless of the number of commands. Byte, retry and timeout counters are kept
+alongside.
+
+    n9 = Communicator(metrics=True)
+    ...
+    n9.metrics.snapshot()  # dictionary of counters and latency percentiles
+    print(n9.metrics.prometheus())  # Prometheus text exposition format
+"""
+import json
+import time
+
+
+class Histogram(object):
+    def __init__(self, precision=7, highest=37):
+        """
+        a log-linear histogram of non-negative integer values
+
+        precision: the number of significant bits kept for each value (7 bits keeps the relative error of
+        reported values below 1 %)
+
+        highest: values are recorded up to 2**highest (2**37 us is 38 hours), larger values are counted in the
+        last bucket
+        """
+        self.precision = precision
+        self.mask = (1 << precision) - 1
+        self.counts = [0] * ((highest - precision + 1) << precision)  # fixed size, safe to read while recording
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __repr__(self):
+        return "%s(count=%d)" % (self.__class__.__name__, self.count)
+
+    def index(self, value):
+        """the bucket index of the value"""
+        shift = value.bit_length() - self.precision - 1
+        if shift <= 0:  # exact for small values
+            return value
+        return min(((shift + 1) << self.precision) | ((value >> shift) & self.mask), len(self.counts) - 1)
+
+    def lowest(self, index):
+        """the lowest value counted in the bucket"""
+        if index >> self.precision <= 1:
+            return index
+        shift = (index >> self.precision) - 1
+        return ((index & self.mask) | (1 << self.precision)) << shift
+
+    def merge(self, other):
+        """adds the values recorded by another histogram of the same precision"""
+        for index, count in enumerate(other.counts):
+            if count != 0:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, percent):
+        """the value below which the provided percentage of the recorded values fall"""
+        if self.count == 0:
+            return None
+        target = max(1, int(round(percent / 100. * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:  # report the highest value the bucket could hold (limited to the recorded range)
+                return min(max(self.lowest(index + 1) - 1, self.min), self.max)
+        return self.max
+
+    def stats(self, percentiles):
+        """a dictionary of the count, total, mean, min, max and the provided percentiles (e.g. 'p99')"""
+        out = {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count != 0 else None,
+            'min': self.min,
+            'max': self.max,
+        }
+        for percent in percentiles:
+            out['p%g' % percent] = self.percentile(percent)
+        return out
+
+    def record(self, value):
+        """counts a value"""
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def reset(self):
+        """clears all recorded values"""
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+
+class Metrics(object):
+    PERCENTILES = (50., 90., 99., 99.9)  # percentiles reported by snapshot
+
+    def __init__(self):
+        """
+        latency histograms (in microseconds) by command type, plus byte, retry and timeout counters
+
+        Commands are identified by the four letter code of the firmware command (e.g. 'MOAX').
+        """
+        self.latency = {}  # histogram for each command code (bytes)
+        self.written = 0  # bytes written to the robot
+        self.read = 0  # bytes read from the robot
+        self.retries = 0  # failed connection attempts which were retried
+        self.timeouts = 0  # commands which were not acknowledged in time
+        self.depth = Histogram()  # number of queued commands sampled whenever a command is queued (threaded mode)
+        self.preemption = Histogram()  # time from a stop or hold request to its confirmation in microseconds
+        self.started = time.monotonic()
+
+    def __repr__(self):
+        return "%s(%d commands)" % (self.__class__.__name__, sum(h.count for h in self.latency.values()))
+
+    def command(self, data, seconds):
+        """records the round-trip time of a packaged command"""
+        code = data[1:5]
+        try:
+            histogram = self.latency[code]
+        except KeyError:
+            histogram = self.latency[code] = Histogram()
+        histogram.record(int(seconds * 1e6))
+
+    def json(self, **kwargs):
+        """the snapshot as a JSON string (keyword arguments are passed to json.dumps)"""
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def merge(self, other):
+        """adds the histograms and counters of another Metrics instance (e.g. to aggregate several robots)"""
+        for code, histogram in list(other.latency.items()):
+            if code not in self.latency:
+                self.latency[code] = Histogram()
+            self.latency[code].merge(histogram)
+        self.written += other.written
+        self.read += other.read
+        self.retries += other.retries
+        self.timeouts += other.timeouts
+        self.depth.merge(other.depth)
+        self.preemption.merge(other.preemption)
+        self.started = min(self.started, other.started)
+
+    def prometheus(self, prefix='nr9'):
+        """the snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP %s_command_latency_seconds Round-trip time from issuing a command to its acknowledgement.' % prefix,
+            '# TYPE %s_command_latency_seconds summary' % prefix,
+        ]
+        for code, stats in sorted(snapshot['commands'].items()):
+            for percent in self.PERCENTILES:
+                lines.append('%s_command_latency_seconds{command="%s",quantile="%g"} %g' % (
+                    prefix, code, percent / 100., stats['p%g' % percent] / 1e6))
+            lines.append('%s_command_latency_seconds_sum{command="%s"} %g' % (prefix, code, stats['total'] / 1e6))
+            lines.append('%s_command_latency_seconds_count{command="%s"} %d' % (prefix, code, stats['count']))
+        for key, name, description, scale in [
+            ('queue_depth', 'queue_depth', 'Commands waiting for the I/O thread when a command is queued.', 1.),
+            ('preemption', 'preemption_latency_seconds', 'Time from a stop or hold request to its confirmation.', 1e6),
+        ]:
+            stats = snapshot[key]
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s summary' % (prefix, name))
+            if stats['count'] != 0:
+                for percent in self.PERCENTILES:
+                    lines.append('%s_%s{quantile="%g"} %g' % (
+                        prefix, name, percent / 100., stats['p%g' % percent] / scale))
+            lines.append('%s_%s_sum %g' % (prefix, name, stats['total'] / scale))
+            lines.append('%s_%s_count %d' % (prefix, name, stats['count']))
+        for name, description in [
+            ('bytes_written', 'Bytes written to the robot.'),
+            ('bytes_read', 'Bytes read from the robot.'),
+            ('retries', 'Failed connection attempts which were retried.'),
+            ('timeouts', 'Commands which were not acknowledged in time.'),
+        ]:
+            lines.append('# HELP %s_%s_total %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            lines.append('%s_%s_total %d' % (prefix, name, snapshot[name]))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """clears all histograms and counters"""
+        self.latency = {}
+        self.written = 0
+        self.read = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.depth.reset()
+        self.preemption.reset()
+        self.started = time.monotonic()
+
+    def snapshot(self):
+        """
+        the current state as a dictionary
+
+        Latencies are reported in microseconds for each command code as count, total, mean, min, max and the
+        percentiles p50, p90, p99 and p99.9 (likewise for the queue depth and the preemption latency).
+        """
+        commands = {}
+        for code, histogram in list(self.latency.items()):
+            if histogram.count != 0:
+                commands[code.decode('ascii')] = histogram.stats(self.PERCENTILES)
+        return {
+            'elapsed': time.monotonic() - self.started,
+            'commands': commands,
+            'bytes_written': self.written,
+            'bytes_read': self.read,
+            'retries': self.retries,
+            'timeouts': self.timeouts,
+            'queue_depth': self.depth.stats(self.PERCENTILES),
+            'preemption': self.preemption.stats(self.PERCENTILES),
+        }
@@ -0,0 +1,190 @@
+"""
+Background polling of the axis counts into a ring buffer in shared memory
+
+A Poller queues a POSR at BACKGROUND priority every interval, so the position requests are only written between
+the commands of the protocol, and writes each report with its time into a fixed-size NumPy ring buffer in
+multiprocessing.shared_memory. Dashboards and analysis scripts in other processes attach to the ring by name
+and read the live state without copies or serial traffic (the communicator must be threaded).
+
+    n9 = Communicator(threaded=True)
+    poller = Poller(n9, interval=0.05, name='nr9-position')
+    ...
+    poller.close()
+    n9.disconnect()
+
+    # in another process
+    ring = PositionRing('nr9-position')
+    t, counts = ring.latest()
+    times, counts = ring.window(1000)  # the last 1000 samples, oldest first
+"""
+from array import array
+from multiprocessing import shared_memory
+import threading
+import time
+
+import numpy as np
+
+from PyNR.dependencies._communicator import BACKGROUND
+from PyNR.dependencies._framing import NAXES, parse_position
+
+HEADER = 4  # int64 header fields: samples written, capacity, axes, reserved
+
+
+class PositionRing(object):
+    def __init__(self, name=None, capacity=None, axes=4):
+        """
+        a ring buffer of timestamped axis counts in shared memory
+
+        name: the name of the shared memory block (a unique name is generated if None)
+
+        capacity: the number of samples kept. If provided, a new ring is created; otherwise the existing ring
+        called name is attached to.
+
+        axes: the number of axes stored in each sample
+
+        Each sample is a row of int64: the wall clock time in ns followed by the counts of each axis. The data
+        attribute is a (capacity, 1 + axes) array on the shared memory itself; row i % capacity holds sample i.
+        """
+        self.owner = capacity is not None  # whether this instance created (and will unlink) the ring
+        if self.owner is True:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=8 * (HEADER + capacity * (1 + axes)))
+        else:
+            if name is None:
+                raise ValueError('A name is required to attach to an existing ring.')
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:  # python < 3.13 registers attached blocks and unlinks them when the reader exits
+                self.shm = shared_memory.SharedMemory(name=name)
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.header = np.ndarray((HEADER,), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner is True:
+            self.header[:] = [0, capacity, axes, 0]
+        self.capacity = int(self.header[1])
+        self.axes = int(self.header[2])
+        self.data = np.ndarray((self.capacity, 1 + self.axes), dtype=np.int64, buffer=self.shm.buf, offset=8 * HEADER)
+
+    def __len__(self):
+        return min(int(self.header[0]), self.capacity - 1)
+
+    def __repr__(self):
+        return "%s(%s, %d/%d samples)" % (self.__class__.__name__, self.name, len(self), self.capacity)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def written(self):
+        """the number of samples written since the ring was created"""
+        return int(self.header[0])
+
+    def append(self, t, counts):
+        """
+        writes a sample (a single writer only)
+
+        t: the time of the sample in ns
+
+        counts: the counts indexed by axis (e.g. an array from _framing.parse_position, at least axes long), or a
+        dictionary of axis counts (missing axes are stored as 0)
+        """
+        row = self.data[int(self.header[0]) % self.capacity]
+        row[0] = t
+        if isinstance(counts, dict):
+            for axis in range(self.axes):
+                row[1 + axis] = counts.get(axis, 0)
+        else:
+            row[1:] = counts[:self.axes]
+        self.header[0] += 1  # publish the sample
+
+    def close(self):
+        """detaches from the shared memory (and removes it if this instance created it)"""
+        self.header = None
+        self.data = None
+        self.shm.close()
+        if self.owner is True:
+            self.shm.unlink()
+
+    def latest(self):
+        """the time (s) and a dictionary of the axis counts of the newest sample (None if nothing was written)"""
+        times, counts = self.window(1)
+        if len(times) == 0:
+            return None
+        return float(times[0]), {axis: int(value) for axis, value in enumerate(counts[0])}
+
+    def window(self, n=None):
+        """
+        copies the newest n samples (all retained samples if None), oldest first
+
+        At most capacity - 1 samples are returned, as the oldest row may be being overwritten by the next sample.
+
+        returns an array of times (s) and an (n, axes) array of counts. The copy is repeated if the writer
+        overwrote any of the samples while they were being copied.
+        """
+        while True:
+            end = int(self.header[0])
+            size = min(end, self.capacity - 1 if n is None else min(n, self.capacity - 1))
+            out = self.data[np.arange(end - size, end) % self.capacity]
+            if int(self.header[0]) - (end - size) < self.capacity:  # none of the copied rows were overwritten
+                return out[:, 0] / 1e9, out[:, 1:]
+
+
+class Poller(object):
+    def __init__(self, communicator, interval=0.05, name=None, capacity=65536, axes=4):
+        """
+        polls the axis counts of a threaded Communicator into a PositionRing
+
+        interval: time between position requests in seconds. A request is skipped while the previous one has
+        not been acknowledged or other commands are queued, so the poller never holds up the protocol (or the
+        disconnection of the communicator) by more than one position request.
+
+        name, capacity, axes: see PositionRing
+        """
+        if communicator.kw['threaded'] is False:
+            raise ValueError('Background polling requires a threaded communicator.')
+        self.n9 = communicator
+        self.interval = interval
+        self.ring = PositionRing(name, capacity, axes)
+        self.counts = array('q', bytes(8 * NAXES))  # reused for every report (each POSR reports every axis)
+        self.future = None  # the outstanding position request
+        self.skipped = 0  # intervals skipped while a request was outstanding
+        self.errors = 0  # position requests which failed
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()  # keeps the ring open while a report is written
+        self.thread = threading.Thread(target=self.run, name='NR9 poller', daemon=True)
+        self.thread.start()
+
+    def __repr__(self):
+        return "%s(%s, %g s)" % (self.__class__.__name__, self.ring.name, self.interval)
+
+    def close(self):
+        """stops polling and removes the ring"""
+        self.stop()
+        with self.lock:
+            self.ring.close()
+
+    def record(self, future):
+        """writes an acknowledged position report to the ring (runs on the I/O thread)"""
+        if future.cancelled() or future.exception() is not None:
+            self.errors += 1
+            return None
+        with self.lock:
+            if self.stopped.is_set() is False:
+                self.ring.append(time.time_ns(), parse_position(future.result(), self.counts))
+
+    def run(self):
+        """queues a position request every interval (runs on the poller thread)"""
+        while self.stopped.wait(self.interval) is False:
+            if (self.future is not None and self.future.done() is False) or self.n9.requests.qsize() != 0:
+                self.skipped += 1
+                continue
+            try:
+                self.future = self.n9.submit('position', priority=BACKGROUND)
+            except Exception:  # the communicator was disconnected
+                return None
+            self.future.add_done_callback(self.record)
+
+    def stop(self):
+        """stops polling (the ring remains readable, an outstanding request is not recorded)"""
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,122 @@
+"""
+A precomputed map of the targets the NR9 arm can reach within its joint limits
+
+The bed is sampled on a grid once per kinematic profile and set of joint ranges (see robot_parameters.params).
+Each grid point stores which of the two elbow configurations of inverse_kinematics reach it with shoulder and
+elbow counts inside the ranges. A lookup reads the grid point nearest the target; near the edges of the
+workspace, where the neighbouring points disagree, the target is solved exactly instead, so the answer never
+depends on the grid resolution.
+
+The grid is saved to the cache directory (the reachcache keyword of the communicator) and reloaded by later
+sessions with the same parameters.
+
+    reach = n9.reachability()
+    reach.lookup(-188.36, 200.585)  # (0, 1): both configurations are within the joint limits
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from PyNR.dependencies._kinematics import inverse
+
+CONFIGURATIONS = [(), (0,), (1,), (0, 1)]  # the valid configurations (indices of inverse_kinematics) by mask
+EDGE = 4  # flags a grid point whose neighbours have a different mask
+
+
+class ReachabilityMap(object):
+    def __init__(self, profile, ranges, resolution=1., cache=None):
+        """
+        maps which elbow configurations reach each point of the bed within the joint limits
+
+        profile: the KinematicProfile of the tool (see head_modules)
+
+        ranges: the [lowest, highest] counts of the elbow (1) and shoulder (2) (see robot_parameters.params)
+
+        resolution: the spacing of the grid in mm
+
+        cache: directory the grid is saved to and loaded from (None to always build it)
+        """
+        self.profile = profile
+        self.ranges = {axis: (ranges[axis][0], ranges[axis][1]) for axis in [1, 2]}
+        self.resolution = resolution
+        self.reach = profile.sh_el + profile.el_gr  # the grid covers every target within reach
+        self.origin = (profile.x_offset - self.reach - resolution, profile.y_offset - self.reach - resolution)
+        self.size = int(np.ceil(2 * (self.reach + resolution) / resolution)) + 1  # grid points along each side
+        key = repr((profile.key, sorted(self.ranges.items()), resolution)).encode()
+        self.path = None
+        if cache is not None:
+            self.path = os.path.join(cache, 'reach-%s.npy' % hashlib.sha1(key).hexdigest()[:16])
+        self.grid = self.load()
+        self.table = self.grid.tobytes()  # row-major copy for lookups without numpy scalars
+
+    def __repr__(self):
+        return "%s(%s, %g mm, %d%% reachable)" % (
+            self.__class__.__name__, self.profile.name, self.resolution,
+            100. * np.count_nonzero(self.grid & 3) / self.grid.size)
+
+    def build(self):
+        """samples the bed and returns the grid of configuration masks and edge flags"""
+        axis = np.arange(self.size) * self.resolution
+        xs, ys = np.meshgrid(self.origin[0] + axis, self.origin[1] + axis, indexing='ij')
+        shright, shleft, reachable = inverse(xs.ravel(), ys.ravel(), self.profile)
+        grid = (self.within(shright) & reachable) | ((self.within(shleft) & reachable) << 1)
+        grid = grid.astype(np.uint8).reshape(self.size, self.size)
+        padded = np.pad(grid, 1, mode='edge')
+        edge = np.zeros(grid.shape, dtype=bool)
+        for dx in [-1, 0, 1]:  # flag the points where any neighbour differs
+            for dy in [-1, 0, 1]:
+                edge |= padded[1 + dx:1 + dx + self.size, 1 + dy:1 + dy + self.size] != grid
+        return grid | (edge.astype(np.uint8) * EDGE)
+
+    def exact(self, x, y):
+        """solves the configurations of a target exactly"""
+        try:
+            options = self.profile.inverse(x, y)
+        except (ValueError, ZeroDivisionError):  # out of reach (or at the shoulder)
+            return ()
+        return tuple(
+            index for index, option in enumerate(options)
+            if self.ranges[1][0] <= option[1] <= self.ranges[1][1] and self.ranges[2][0] <= option[2] <= self.ranges[2][1]
+        )
+
+    def load(self):
+        """loads the grid from the cache directory, building (and saving) it if it is missing"""
+        if self.path is not None and os.path.isfile(self.path):
+            try:
+                grid = np.load(self.path)
+                if grid.shape == (self.size, self.size):
+                    return grid
+            except (OSError, ValueError):  # a damaged cache file is rebuilt
+                pass
+        grid = self.build()
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temporary = self.path + '.%d.tmp' % os.getpid()
+            with open(temporary, 'wb') as cachefile:  # write then replace so a crash never leaves a partial file
+                np.save(cachefile, grid)
+            os.replace(temporary, self.path)
+        return grid
+
+    def lookup(self, x, y):
+        """
+        returns the configurations which reach the target within the joint limits, as indices into the options
+        returned by inverse_kinematics ((0, 1) for both, () if the target cannot be reached)
+        """
+        i = int(round((x - self.origin[0]) / self.resolution))
+        j = int(round((y - self.origin[1]) / self.resolution))
+        if i < 0 or j < 0 or i >= self.size or j >= self.size:  # beyond the reach of the arm
+            return ()
+        mask = self.table[i * self.size + j]
+        if mask & EDGE:  # near the edge of the workspace
+            return self.exact(x, y)
+        return CONFIGURATIONS[mask]
+
+    def reachable(self, x, y):
+        """whether any configuration reaches the target within the joint limits"""
+        return len(self.lookup(x, y)) != 0
+
+    def within(self, counts):
+        """whether each pair of elbow and shoulder counts is inside the joint ranges"""
+        return ((counts[1] >= self.ranges[1][0]) & (counts[1] <= self.ranges[1][1])
+                & (counts[2] >= self.ranges[2][0]) & (counts[2] <= self.ranges[2][1]))
@@ -0,0 +1,187 @@
+"""
+Transports which connect the communicator to the robot
+
+Any object with the pyserial Serial interface (write, read, in_waiting, timeout, close) may be used as a
+transport. open_transport resolves the ports that pyserial understands:
+
+    'COM6'                      Windows serial port
+    '/dev/ttyUSB0'              Linux/macOS serial device (or a pseudo-terminal such as '/dev/pts/3')
+    'socket://10.0.0.12:4001'   raw TCP serial server
+    'rfc2217://10.0.0.12:4001'  RFC 2217 (telnet com port control) serial server
+    'loop://'                   loopback (everything written is read back)
+
+Sessions can be recorded by wrapping a transport in a Recorder and served again offline by a ReplayTransport,
+which makes it possible to measure host-side overhead of a production run without the robot.
+"""
+from collections import deque
+import struct
+import threading
+import time
+
+
+def open_transport(port, baudrate=115200, timeout=1):
+    """
+    opens a pyserial transport for the provided port
+
+    port: a pyserial URL or device path (see above). An integer is treated as a Windows COM port number.
+    """
+    from serial import serial_for_url  # import pyserial
+    if type(port) == int:
+        port = 'COM%d' % port
+    return serial_for_url(port, baudrate=baudrate, timeout=timeout)
+
+
+def retry_delays(attempts, first=0.1, longest=2.):
+    """yields the delay before each connection attempt (none before the first, then doubling up to longest)"""
+    if attempts < 1:
+        raise ValueError('At least one connection attempt must be made (connectionattempts is %r).' % attempts)
+    delay = 0.
+    for attempt in range(attempts):
+        yield delay
+        delay = first if delay == 0. else min(delay * 2, longest)
+
+
+class Recorder(object):
+    HEADER = b'NR9REC\x01\n'  # file signature and format version
+    RECORD = struct.Struct('<cQI')  # direction (b'W' written, b'R' read), monotonic ns since start, length
+
+    def __init__(self, transport, path):
+        """
+        wraps a transport and records everything written to and read from it in a compact binary log
+
+        Each chunk is stored as a direction byte, the monotonic time in ns since the recording started and the
+        length, followed by the bytes. Logs are read back with read_recording or served by ReplayTransport.
+        """
+        self.transport = transport
+        self.log = open(path, 'wb')
+        self.log.write(self.HEADER)
+        self.t0 = time.monotonic_ns()
+
+    def __getattr__(self, item):  # anything not recorded is handed to the wrapped transport
+        return getattr(self.transport, item)
+
+    @property
+    def in_waiting(self):
+        return self.transport.in_waiting
+
+    @property
+    def timeout(self):
+        return self.transport.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.transport.timeout = value
+
+    def close(self):
+        self.transport.close()
+        self.log.close()
+
+    def read(self, size=1):
+        data = self.transport.read(size)
+        if len(data) != 0:
+            self.log.write(self.RECORD.pack(b'R', time.monotonic_ns() - self.t0, len(data)) + data)
+        return data
+
+    def write(self, data):
+        self.log.write(self.RECORD.pack(b'W', time.monotonic_ns() - self.t0, len(data)) + data)
+        return self.transport.write(data)
+
+
+def read_recording(path):
+    """reads a log written by Recorder and returns a list of (direction, seconds since start, bytes)"""
+    with open(path, 'rb') as log:
+        data = log.read()
+    if data.startswith(Recorder.HEADER) is False:
+        raise ValueError('%s is not an NR9 session recording' % path)
+    out = []
+    i = len(Recorder.HEADER)
+    while i < len(data):
+        direction, t, length = Recorder.RECORD.unpack_from(data, i)
+        i += Recorder.RECORD.size
+        out.append((direction, t / 1e9, data[i:i + length]))
+        i += length
+    return out
+
+
+class ReplayTransport(object):
+    def __init__(self, path, timescale=1., timeout=1):
+        """
+        a transport which serves the responses of a session recorded by Recorder
+
+        Each recorded response is released once the bytes written before it in the recording have been written
+        again, after its original delay (from the last of those writes) multiplied by timescale. A timescale of 0
+        serves responses as soon as they are due, which isolates the host-side time of a run.
+
+        Written bytes which differ from the recording are counted in mismatches.
+        """
+        self.timeout = timeout
+        self.timescale = timescale
+        self.written = bytearray()  # everything written during the recording
+        self.responses = deque()  # (written byte count which triggers the response, delay, bytes)
+        lastwrite = 0.
+        for direction, t, data in read_recording(path):
+            if direction == b'W':
+                self.written += data
+                lastwrite = t
+            else:
+                self.responses.append((len(self.written), t - lastwrite, data))
+        self.position = 0  # number of bytes written during the replay
+        self.mismatches = 0  # number of writes which did not match the recording
+        self.scheduled = deque()  # (release time, bytes) of triggered responses
+        self.buffer = bytearray()  # released bytes which have not been read
+        self.cancelled = threading.Event()
+        self.trigger(time.monotonic())
+
+    @property
+    def in_waiting(self):
+        self.release()
+        return len(self.buffer)
+
+    def cancel_read(self):
+        self.cancelled.set()
+
+    def close(self):
+        pass
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self.release()
+        while len(self.buffer) == 0:
+            if len(self.scheduled) != 0:  # sleep until the next response is due (or the deadline)
+                wait = self.scheduled[0][0] - time.monotonic()
+            else:
+                wait = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return b''
+                wait = remaining if wait is None else min(wait, remaining)
+            if self.cancelled.wait(wait):
+                self.cancelled.clear()
+                return b''
+            self.release()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def release(self):
+        """moves responses which are due into the read buffer"""
+        now = time.monotonic()
+        while len(self.scheduled) != 0 and self.scheduled[0][0] <= now:
+            self.buffer += self.scheduled.popleft()[1]
+
+    def trigger(self, now):
+        """schedules the responses whose preceding writes have been replayed"""
+        while len(self.responses) != 0 and self.responses[0][0] <= self.position:
+            trigger, delay, data = self.responses.popleft()
+            due = now + delay * self.timescale
+            if len(self.scheduled) != 0:  # responses are released in the recorded order
+                due = max(due, self.scheduled[-1][0])
+            self.scheduled.append((due, data))
+
+    def write(self, data):
+        if bytes(self.written[self.position:self.position + len(data)]) != bytes(data):
+            self.mismatches += 1
+        self.position += len(data)
+        self.trigger(time.monotonic())
+        return len(data)
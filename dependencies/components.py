@@ -187,12 +187,15 @@ class VialTray(object):
             'vialproperties': {},  # any special vial properties
             'iterorder': 'across',  # either across or down, will interate across first or down first respectively
             'vialbottoms': 23.87,  # the bottom of the vials (relative to the bed)
+            'reachability': None,  # a ReachabilityMap to check the cells against (e.g. n9.reachability())
         }
         self.kw.update(kwargs)  # updates default keywords as specified
         from PyNR.dependencies.general import cellname_to_inds
         self.cti = cellname_to_inds
         self.vials = self.vialarray(self.kw['vialarray'])  # create an array for vials
         self.locarray = self.locationarray()  # store location values
+        if self.kw['reachability'] is not None:
+            self.checkreach(self.kw['reachability'])
         self.populate(self.population, self.locarray)
 
     def __iter__(self):
@@ -226,6 +229,18 @@ class VialTray(object):
             self.vial = vial
             super(VialTray.CellEmpty, self).__init__('The selected vial %s is defined as empty' % self.vial)
 
+    def checkreach(self, reachability):
+        """raises UnreachableTarget if the arm cannot reach any of the cells (see communicator.checkreach)"""
+        from PyNR.dependencies._communicator import UnreachableTarget
+        from PyNR.dependencies.general import inds_to_cellname
+        unreachable = []
+        for row, locations in enumerate(self.locarray):
+            for col, location in enumerate(locations):
+                if reachability.reachable(location['x'], location['y']) is False:
+                    unreachable.append(inds_to_cellname(row, col))
+        if len(unreachable) != 0:
+            raise UnreachableTarget('cell(s) %s of the tray' % ', '.join(unreachable))
+
     def locationarray(self):
         """
         creates a location array based on the sizing and spacing parameters provided to the class
@@ -0,0 +1,329 @@
+"""
+A long-running daemon which owns the serial port and serves the robot to other processes over a Unix socket
+
+Only one process can open the serial port, so a protocol runner, a LIMS bridge and a dashboard share the robot
+through the daemon instead (and do not each pay the cost of connecting and homing). Robot operations are
+executed one at a time in the order they arrive. Status reads are answered from the cached state without
+waiting for the robot, and stop, hold and release preempt the operation in progress (the communicator must
+be threaded).
+
+Every message is a 4 byte big-endian length followed by a UTF-8 JSON body. A request is
+
+    {"id": 1, "op": "goto", "args": [{"x": -188.36, "y": 200.585}, {"3": 8700}], "kwargs": {}}
+
+or a batch of requests which are executed back to back (moves are streamed if sendahead > 1)
+
+    {"id": 2, "batch": [{"op": "goto", "args": [{"3": 7000}]}, {"op": "output", "args": ["gripper", 0]}]}
+
+and the response is {"id": 1, "ok": true, "result": ...} (a list of results for a batch) or
+{"id": 1, "ok": false, "error": "NoResponse", "message": "..."}. Axis keys of position dictionaries are sent as
+strings and converted back to integers. A position may also refer to a tray cell: {"tray": "VT", "cell": "G9"}.
+
+Run the daemon (Linux/macOS):
+
+    python -m PyNR.dependencies.daemon --socket /tmp/nr9.sock --port /dev/ttyUSB0
+
+and connect from any number of processes:
+
+    client = DaemonClient('/tmp/nr9.sock')
+    client.goto({3: 9000})
+    client.batch([('goto', {3: 7000}), ('output', 'gripper', 1)])
+    client.status()
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+HEADER = struct.Struct('>I')  # length of the message body
+MAXMESSAGE = 16 * 1024 * 1024  # largest accepted message body in bytes
+
+
+class DaemonError(Exception):
+    def __init__(self, error, message):
+        """an error raised by the daemon while executing a request"""
+        self.error = error  # the name of the exception raised in the daemon
+        super(DaemonError, self).__init__('%s: %s' % (error, message))
+
+
+def encode(obj):
+    """converts values which are not JSON serializable (e.g. numpy floats and items)"""
+    if hasattr(obj, 'item'):  # numpy scalars
+        return obj.item()
+    if hasattr(obj, 'tolist'):  # numpy arrays
+        return obj.tolist()
+    return str(obj)
+
+
+def receive_message(sock):
+    """receives a framed message, returns None if the connection was closed"""
+    header = receive_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    length, = HEADER.unpack(header)
+    if length > MAXMESSAGE:
+        raise ValueError('A message of %d bytes exceeds the maximum of %d bytes' % (length, MAXMESSAGE))
+    body = receive_exactly(sock, length)
+    if body is None:
+        return None
+    return json.loads(body.decode('utf-8'))
+
+
+def receive_exactly(sock, size):
+    """receives exactly size bytes, returns None if the connection was closed first"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if len(chunk) == 0:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock, obj):
+    """sends an object as a framed message"""
+    body = json.dumps(obj, separators=(',', ':'), default=encode).encode('utf-8')
+    sock.sendall(HEADER.pack(len(body)) + body)
+
+
+class RobotDaemon(object):
+    OPERATIONS = [  # requests which are executed on the robot (one at a time)
+        'drain', 'execute', 'goto', 'home', 'output', 'pickup', 'place', 'position', 'spin',
+    ]
+    CONTROL = [  # requests which are answered without waiting for the robot
+        'hold', 'release', 'status', 'stop', 'tray',
+    ]
+
+    def __init__(self, path, communicator, trays=None):
+        """
+        serves a Communicator on the Unix socket at path
+
+        trays: dictionary of named VialTray instances that positions, pickup and place may refer to
+        """
+        self.path = path
+        self.n9 = communicator
+        self.trays = trays if trays is not None else {}
+        self.lock = threading.Lock()  # serializes robot operations
+        self.waiting = 0  # number of requests waiting for the robot
+        self.served = 0  # number of requests served
+        self.clients = 0  # number of connected clients
+        self.started = time.time()
+        self.server = None
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.path)
+
+    def axes(self, dct):
+        """converts the axis keys of a position dictionary back to integers and resolves tray cells"""
+        if 'tray' in dct:
+            if 'cell' not in dct:
+                raise ValueError('A tray position requires a cell')
+            return dict(self.trays[dct['tray']][dct['cell']])
+        return {int(key) if key.isdigit() else key: value for key, value in dct.items()}
+
+    def call(self, op, args=(), kwargs=None):
+        """executes a single operation and returns its result"""
+        if kwargs is None:
+            kwargs = {}
+        if op == 'status':  # served from the cached state
+            return self.status()
+        if op == 'tray':
+            return self.tray(*args)
+        if op in ['hold', 'release', 'stop']:  # preempt the operation in progress (threaded communicators only)
+            if self.n9.kw['threaded'] is False:
+                raise ValueError("'%s' requires a threaded communicator" % op)
+            return getattr(self.n9, op)(*args, **kwargs)
+        if op not in self.OPERATIONS:
+            raise ValueError("The operation '%s' is not supported" % op)
+        args = [self.axes(arg) if type(arg) == dict else arg for arg in args]
+        if op == 'pickup':  # pickup a vial by tray and vial name
+            args = [self.vial(*args)]
+        elif op == 'position' and kwargs.pop('cached', False) is True:
+            return self.status()['loc']
+        return getattr(self.n9, op)(*args, **kwargs)
+
+    def handle(self, request):
+        """executes a request (or a batch of requests) and returns the response"""
+        response = {'id': request.get('id')}
+        try:
+            if 'batch' in request:
+                robot = any(item['op'] not in self.CONTROL for item in request['batch'])
+            else:
+                robot = request['op'] not in self.CONTROL
+            if robot is True:  # wait for the robot
+                self.waiting += 1
+                try:
+                    with self.lock:
+                        response['result'] = self.run(request)
+                finally:
+                    self.waiting -= 1
+            else:
+                response['result'] = self.run(request)
+            response['ok'] = True
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = e.__class__.__name__
+            response['message'] = str(e)
+        self.served += 1
+        return response
+
+    def run(self, request):
+        """runs a request or a batch of requests"""
+        if 'batch' in request:
+            out = [self.call(item['op'], item.get('args', ()), item.get('kwargs')) for item in request['batch']]
+            if any(item['op'] == 'goto' for item in request['batch']):  # wait for streamed moves
+                self.n9.drain()
+            return out
+        return self.call(request['op'], request.get('args', ()), request.get('kwargs'))
+
+    def serve_forever(self):
+        """serves clients until shutdown is called"""
+        daemon = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                daemon.clients += 1
+                try:
+                    while True:
+                        request = receive_message(self.request)
+                        if request is None:  # the client disconnected
+                            return None
+                        send_message(self.request, daemon.handle(request))
+                except (ConnectionError, ValueError):
+                    return None
+                finally:
+                    daemon.clients -= 1
+
+        if os.path.exists(self.path):  # a socket left behind by a previous daemon
+            os.remove(self.path)
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.remove(self.path)
+
+    def shutdown(self):
+        """stops serving (call from another thread)"""
+        self.server.shutdown()
+
+    def start(self):
+        """serves clients from a background thread"""
+        thread = threading.Thread(target=self.serve_forever, name='NR9 daemon', daemon=True)
+        thread.start()
+        while self.server is None:  # wait for the socket to exist
+            time.sleep(0.001)
+        return thread
+
+    def status(self):
+        """the cached state of the robot and the daemon (does not wait for the robot)"""
+        gripper = self.n9.in_gripper
+        return {
+            'loc': {axis: counts for axis, counts in list(self.n9.loc.items()) if type(axis) == int},
+            'gripper': getattr(gripper, 'name', None),
+            'busy': self.lock.locked(),
+            'waiting': self.waiting,
+            'clients': self.clients,
+            'served': self.served,
+            'offline': self.n9.kw['offline'],
+            'uptime': time.time() - self.started,
+            'metrics': self.n9.metrics.snapshot() if self.n9.metrics is not None else None,
+        }
+
+    def tray(self, name=None):
+        """the name, location and capped state of every vial of a tray (or of every tray)"""
+        if name is None:
+            return {name: self.tray(name) for name in self.trays}
+        return [{'name': vial.name, 'location': vial.location, 'capped': vial.capped} for vial in self.trays[name]]
+
+    def vial(self, tray, name):
+        """retrieves a Vial instance by tray and vial name"""
+        for vial in self.trays[tray]:
+            if vial.name == name:
+                return vial
+        raise KeyError('There is no vial %s in tray %s' % (name, tray))
+
+
+class DaemonClient(object):
+    def __init__(self, path, timeout=None):
+        """connects to a RobotDaemon on the Unix socket at path"""
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.id = 0
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.path)
+
+    def batch(self, requests):
+        """
+        executes several requests back to back in a single round trip and returns a list of their results
+
+        requests: a list of (operation, *arguments) tuples, e.g. [('goto', {3: 7000}), ('output', 'gripper', 1)]
+        """
+        return self.request({'batch': [{'op': item[0], 'args': list(item[1:])} for item in requests]})
+
+    def call(self, op, *args, **kwargs):
+        """executes an operation on the daemon and returns its result"""
+        return self.request({'op': op, 'args': list(args), 'kwargs': kwargs})
+
+    def close(self):
+        self.sock.close()
+
+    def execute(self, cmd, *args, **kwargs):
+        return self.call('execute', cmd, *args, **kwargs)
+
+    def goto(self, *args, **kwargs):
+        return self.call('goto', *args, **kwargs)
+
+    def output(self, axis, value, **kwargs):
+        return self.call('output', axis, value, **kwargs)
+
+    def position(self, cached=False):
+        """the axis counts of the robot (cached: the tracked counts, without waiting for the robot)"""
+        return {int(axis): counts for axis, counts in self.call('position', cached=cached).items() if axis.isdigit()}
+
+    def request(self, request):
+        """sends a request and returns the result of the response (raises DaemonError on failure)"""
+        self.id += 1
+        request['id'] = self.id
+        send_message(self.sock, request)
+        response = receive_message(self.sock)
+        if response is None:
+            raise ConnectionError('The daemon closed the connection')
+        if response['ok'] is False:
+            raise DaemonError(response['error'], response['message'])
+        return response['result']
+
+    def status(self):
+        """the cached state of the robot and the daemon"""
+        return self.call('status')
+
+    def stop(self):
+        """stops the robot, dropping everything queued (see Communicator.stop)"""
+        return self.call('stop')
+
+
+if __name__ == '__main__':
+    import argparse
+    from PyNR.dependencies._communicator import Communicator
+    parser = argparse.ArgumentParser(description='Serves an NR9 robot to other processes over a Unix socket')
+    parser.add_argument('--socket', default='/tmp/nr9.sock', help='path of the Unix socket')
+    parser.add_argument('--port', default=None, help='device path or pyserial URL of the robot')
+    parser.add_argument('--sendahead', type=int, default=1, help='commands in flight before waiting')
+    parser.add_argument('--statefile', default=None, help='path of the saved axis state for warm starts')
+    options = parser.parse_args()
+
+    n9 = Communicator(port=options.port, sendahead=options.sendahead, statefile=options.statefile, metrics=True,
+                      threaded=True)
+    daemon = RobotDaemon(options.socket, n9)
+    print('Serving the NR9 on %s' % options.socket)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        n9.disconnect()
@@ -96,4 +96,45 @@ def inds_to_cellname(row, col):
         module = (div - 1) % 26
         string += chr(65 + module)
         div = int((div - module) / 26)
-    return string[::-1] + str(col + 1)  # string order must be reversed to be accurate
\ No newline at end of file
+    return string[::-1] + str(col + 1)  # string order must be reversed to be accurate
+
+def movetime(counts, velocity, acceleration):
+    """
+    Calculates the time taken for an axis to travel the provided number of counts with a trapezoidal
+    velocity profile (constant acceleration up to the velocity, cruise, and a symmetric deceleration).
+
+    **Parameters**
+
+    counts: *float*
+        The distance to travel in counts (the sign is ignored).
+
+    velocity: *float*
+        The cruise velocity in counts/s.
+
+    acceleration: *float*
+        The acceleration (and deceleration) in counts/s^2.
+
+
+    **Returns**
+
+    time: *float*
+        The duration of the move in seconds.
+
+
+    **Examples**
+
+    ::
+
+        >>> movetime(20000, 10000, 75000)
+        2.1333333333333333
+        >>> movetime(500, 10000, 75000)
+        0.16329931618554522
+
+    **Notes**
+
+    If the distance is too short to reach the cruise velocity, the profile is triangular.
+    """
+    counts = abs(counts)
+    if counts * acceleration >= velocity ** 2:  # the axis reaches the cruise velocity
+        return counts / velocity + velocity / acceleration
+    return 2. * (counts / acceleration) ** 0.5  # triangular profile
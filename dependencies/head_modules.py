@@ -2,7 +2,106 @@
 The series of head modules that may be installed on the end of the NR9's arm
 
 pipette thingy, gripper, dispenser
+
+The kinematics of the arm depend on the head installed (a dispenser reaches further than the gripper), so each
+head carries a KinematicProfile of its own. A profile is derived once (and again only when the kinematic
+parameters of the communicator change) and handed to the communicator instead of keyword overrides:
+
+    dispenser = Head(n9, tool='dispenser')
+    n9.goto({'x': -188.36, 'y': 200.585}, tool=dispenser)
 """
+import math
+
+from PyNR.dependencies._communicator import KINEMATICS
+
+FIELDS = KINEMATICS + ('zbedzero', 'zcountspermm')  # parameters held by a kinematic profile
+
+
+class KinematicProfile(object):
+    def __init__(self, name, parameters):
+        """
+        The kinematic constants of the arm with a tool attached, derived once so that the kinematics do no
+        dictionary work per call
+
+        name: the name of the tool (e.g. 'dispenser')
+
+        parameters: dictionary providing every kinematic parameter (see FIELDS; other keys are ignored)
+
+        Profiles with the same parameters are equal, so they share inverse kinematics cache entries.
+        """
+        self.name = name
+        self.key = tuple(parameters[field] for field in FIELDS)
+        for field, value in zip(FIELDS, self.key):
+            setattr(self, field, value)
+        self.sh_el2 = self.sh_el ** 2  # squared link lengths
+        self.el_gr2 = self.el_gr ** 2
+        self.gammadivisor = -2 * self.sh_el * self.el_gr  # divisors of the law of cosines
+        self.insidedivisor = 2 * self.sh_el
+        self.sh_cprad = self.sh_cpr / (2 * math.pi)  # counts per radian
+        self.el_cprad = self.el_cpr / (2 * math.pi)
+        self.derived = {}  # profiles derived from this one by overrides
+
+    def __eq__(self, other):
+        return isinstance(other, KinematicProfile) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "%s(%s, sh_el=%g, el_gr=%g)" % (self.__class__.__name__, self.name, self.sh_el, self.el_gr)
+
+    def derive(self, name=None, **overrides):
+        """
+        returns a profile with some of the parameters replaced (e.g. el_gr for a longer tool)
+
+        Keys which are not kinematic parameters are ignored. The profile itself is returned if nothing changes.
+        """
+        if name is None and len(overrides) == 0:
+            return self
+        changed = tuple((field, overrides[field]) for field in FIELDS if field in overrides)
+        if name in (None, self.name) and all(getattr(self, field) == value for field, value in changed):
+            return self
+        if (name, changed) not in self.derived:  # derive each variant once
+            parameters = dict(zip(FIELDS, self.key))
+            parameters.update(changed)
+            self.derived[(name, changed)] = KinematicProfile(self.name if name is None else name, parameters)
+        return self.derived[(name, changed)]
+
+    def forward(self, shoulder, elbow):
+        """converts shoulder and elbow counts into the uncorrected x and y coordinates (see forward_kinematics)"""
+        sh = (shoulder - self.sh_zero) / self.sh_cprad  # shoulder angle
+        el = (self.el_zero - elbow) / self.el_cprad  # elbow angle
+        x = self.sh_el * math.cos(sh) + self.el_gr * math.cos(sh + el)
+        y = self.sh_el * math.sin(sh) + self.el_gr * math.sin(sh + el)
+        return -y, x  # TODO figure out why x and y are reversed
+
+    def inverse(self, x, y):
+        """
+        converts x and y coordinates into the counts of both elbow configurations (see inverse_kinematics)
+
+        raises ValueError (a math domain error) if the target is out of reach
+        """
+        x_corr = x - self.x_offset  # correct x
+        y_corr = y - self.y_offset  # correct y
+        gamma = math.pi - math.acos(  # shoulder-elbow-gripper outside angle (elbow angle from straight out, no sign)
+            (x_corr ** 2 + y_corr ** 2 - self.sh_el2 - self.el_gr2) / self.gammadivisor
+        )
+        pseudoline = math.sqrt(x_corr ** 2 + y_corr ** 2)  # length of pseudoline (hypotenuse)
+        pseudoangle = math.atan2(y_corr, x_corr) - math.pi / 2
+        inside = math.acos(  # shoulder-elbow-gripper angle
+            (self.sh_el2 + pseudoline ** 2 - self.el_gr2) / (self.insidedivisor * pseudoline)
+        )
+        gamma *= self.el_cprad
+        shright = {  # shoulder right, elbow left
+            2: round((pseudoangle - inside) * self.sh_cprad + self.sh_zero),
+            1: round(self.el_zero - gamma),
+        }
+        shleft = {  # shoulder left, elbow right
+            2: round((pseudoangle + inside) * self.sh_cprad + self.sh_zero),
+            1: round(self.el_zero + gamma),
+        }
+        return shright, shleft
+
 
 class Head(object):
     def __init__(self, comms, **kwargs):
@@ -22,11 +121,19 @@ class Head(object):
         
         ncounts: 50000
             If rotary is True, how many counts for a full rotation. Options: integer. 
+        
+        tool: None
+            The name of the kinematic profile of the head (see robot_parameters.tools). None is the bare arm.
+        
+        kinematics: {}
+            Kinematic parameters of the head overriding those of the tool (e.g. {'el_gr': 210.879}).
         """
         
         self.kw = {
             'rotary': False, # whether the robot head rotates
             'ncounts': 50000, # how many counts for a full rotation
+            'tool': None, # name of the kinematic profile
+            'kinematics': {}, # overrides of the kinematic parameters
             }
         
         if set(kwargs.keys()) - set(self.kw.keys()): # check for invalid keyword arguments
@@ -35,6 +142,12 @@ class Head(object):
                 string += ' %s' %i
             raise KeyError('Unsupported keyword argument(s): %s' %string)
         self.kw.update(kwargs) # update defaults with provided keyword arguments
+        self.comms = comms
+    
+    @property
+    def profile(self):
+        """the KinematicProfile of the head (follows the kinematic parameters of the communicator)"""
+        return self.comms.tool(self.kw['tool']).derive(**self.kw['kinematics'])
     
     # ask Allan whether to do R,theta or cartesian for mapping the head attachments
 
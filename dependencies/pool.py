@@ -0,0 +1,157 @@
+"""
+Drives several NR9 cells from one process
+
+Each robot gets its own Communicator and its own worker thread, which is the only thread that talks to that
+robot. Work is dispatched to the workers and returned as futures, so the cells run concurrently and a stalled
+serial link only holds up its own worker.
+
+    pool = RobotPool({
+        'cell1': {'port': '/dev/ttyUSB0'},
+        'cell2': {'port': '/dev/ttyUSB1'},
+    }, velocity=15000)
+    futures = pool.map(protocol, trays)  # runs protocol(n9, tray) on every cell at once
+    results = pool.gather(futures)
+    pool.status()
+    pool.close()
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+
+from PyNR.dependencies._communicator import Communicator
+from PyNR.dependencies._metrics import Metrics
+
+
+class RobotPool(object):
+    def __init__(self, robots, **kwargs):
+        """
+        creates (and homes) a Communicator for each robot concurrently
+
+        robots: dictionary of robot names and their Communicator keyword arguments (e.g. {'cell1': {'port':
+        '/dev/ttyUSB0'}}). A Communicator instance may be provided instead of keyword arguments.
+
+        Other keyword arguments are passed to every Communicator.
+
+        A robot which could not be created is left out of the pool and its error is stored in the errors
+        attribute.
+        """
+        self.robots = {}  # communicator of each robot by name
+        self.workers = {}  # single thread executor of each robot
+        self.errors = {}  # the last error of each robot
+        self.queued = {}  # number of calls waiting for or running on the worker of each robot
+        self.lock = threading.Lock()
+        for name in robots:
+            self.workers[name] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='NR9 %s' % name)
+            self.queued[name] = 0
+        created = {}
+        for name, robot in robots.items():
+            if isinstance(robot, Communicator):
+                self.robots[name] = robot
+                continue
+            options = dict(kwargs)
+            options.update(robot)
+            created[name] = self.workers[name].submit(Communicator, **options)  # connect and home concurrently
+        for name, future in created.items():
+            try:
+                self.robots[name] = future.result()
+            except Exception as e:
+                self.errors[name] = e
+                self.workers.pop(name).shutdown(wait=False)
+
+    def __contains__(self, name):
+        return name in self.robots
+
+    def __getitem__(self, name):
+        return self.robots[name]
+
+    def __iter__(self):
+        return iter(self.robots)
+
+    def __len__(self):
+        return len(self.robots)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ', '.join(self.robots))
+
+    def broadcast(self, method, *args, **kwargs):
+        """calls the Communicator method on every robot concurrently and returns a dictionary of futures"""
+        return {name: self.submit(name, method, *args, **kwargs) for name in self.robots}
+
+    def close(self, roughhome=True):
+        """disconnects every robot concurrently and stops the workers"""
+        futures = self.broadcast('disconnect', roughhome=roughhome)
+        wait(list(futures.values()))
+        for worker in self.workers.values():
+            worker.shutdown()
+
+    def gather(self, futures, timeout=None):
+        """
+        waits for a dictionary of futures and returns a dictionary of their results
+
+        A robot which failed (or did not finish within the timeout in seconds) maps to its exception instead
+        of raising it, so the results of the other robots are not lost.
+        """
+        done, notdone = wait(list(futures.values()), timeout)
+        out = {}
+        for name, future in futures.items():
+            if future in notdone:
+                out[name] = TimeoutError('%s did not finish within %s s' % (name, timeout))
+                continue
+            error = future.exception()
+            out[name] = error if error is not None else future.result()
+        return out
+
+    def map(self, function, *iterables):
+        """
+        runs function(communicator, *arguments) on every robot concurrently and returns a dictionary of futures
+
+        iterables: optional sequences with one argument per robot (in the order of the pool)
+        """
+        arguments = zip(*iterables) if len(iterables) != 0 else ((),) * len(self.robots)
+        return {name: self.run(name, function, *args) for name, args in zip(self.robots, arguments)}
+
+    def metrics(self):
+        """aggregate Metrics of every robot which records them (see the metrics keyword of Communicator)"""
+        out = Metrics()
+        for robot in self.robots.values():
+            if robot.metrics is not None:
+                out.merge(robot.metrics)
+        return out
+
+    def run(self, name, function, *args, **kwargs):
+        """runs function(communicator, *args, **kwargs) on the worker of the robot and returns a future"""
+        def call():
+            try:
+                return function(self.robots[name], *args, **kwargs)
+            except Exception as e:
+                with self.lock:
+                    self.errors[name] = e
+                raise
+            finally:
+                with self.lock:
+                    self.queued[name] -= 1
+        with self.lock:
+            self.queued[name] += 1
+        return self.workers[name].submit(call)
+
+    def status(self):
+        """
+        a dictionary of the state of every robot: the number of pending calls, the tracked location, the
+        number of commands in flight, whether it is offline and its last error
+        """
+        out = {}
+        for name, robot in self.robots.items():
+            out[name] = {
+                'queued': self.queued[name],
+                'loc': {axis: counts for axis, counts in list(robot.loc.items()) if type(axis) == int},
+                'inflight': len(robot.inflight),
+                'offline': robot.kw['offline'],
+                'error': repr(self.errors[name]) if name in self.errors else None,
+            }
+        for name in self.errors:
+            if name not in self.robots:  # robots which could not be created
+                out[name] = {'error': repr(self.errors[name])}
+        return out
+
+    def submit(self, name, method, *args, **kwargs):
+        """calls the Communicator method (e.g. 'goto') on the worker of the robot and returns a future"""
+        return self.run(name, lambda robot: getattr(robot, method)(*args, **kwargs))
@@ -35,6 +35,15 @@ outputs = {  # outputs
     6: None,
     7: None,
 }
+settle = {  # time (s) an output takes to actuate once it is set, and the axes whose moves must wait for it
+    'gripper': {'time': 0.2, 'axes': [0, 1, 2, 3]},  # every move carries what the gripper holds
+    'vial_gripper': {'time': 0.2, 'axes': [0, 3]},  # the gripper rotation and z act on the clamped vial
+    None: {'time': 0.2, 'axes': [0, 1, 2, 3]},  # outputs without a name
+}
+
+tools = {  # kinematic parameters of the tools installed on the arm which differ from the bare arm (see head_modules)
+    'dispenser': {'el_gr': 210.879},  # the dispenser reaches further than the gripper
+}
 
 components = {  # locations for components installed on the N9 bed
     'vial_gripper': {  # vial gripper for uncapping
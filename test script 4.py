@@ -46,7 +46,7 @@ for ind,vial in enumerate(VT):
 
     # n9.output(3,0) # uncomment when uncap has happened
     if disploc is None:
-        disploc = n9.chooseangle(n9.inverse_kinematics(-188.36,200.585,el_gr=210.879))
+        disploc = n9.chooseangle(n9.inverse_kinematics(-188.36,200.585,tool='dispenser'))
     n9.goto({3:7000},disploc,{3:8700})
     time.sleep(0.5) # wait for "fill"
     n9.goto({3:7000},ucloc,{3:upcounts})